@@ -0,0 +1,106 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Speed-up of the required-literal prefilter.
+
+    python benchmarks/prefilter.py [REPEAT]
+
+Scans a generated log of LINES lines, 1% of them ERROR lines, with
+regex.finditer() and with the prefiltered CompiledPattern.finditer(),
+and prints the best process time of REPEAT runs of each.
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'src'))
+
+from pyregs.analyzer import pattern_cache
+from pyregs.store import MatchStore
+
+LINES = 300000
+PATTERNS = (
+    r'user_id=(\d+)',
+    r'ERROR user_id=(\d+)',
+    r'\d\d ERROR',
+    r'[a-z]{2}_id=\d+',
+    r'\s\w{5} user_id',
+    r'items/(\d+)',
+)
+
+
+def make_log(lines, seed=0):
+    rnd = random.Random(seed)
+    out = []
+    for i in range(lines):
+        level = 'ERROR' if rnd.random() < 0.01 else 'INFO'
+        line = '2013-05-{:02d} {:02d}:{:02d}:{:02d} {} '.format(
+            rnd.randint(1, 31), rnd.randint(0, 23), rnd.randint(0, 59),
+            rnd.randint(0, 59), level)
+        if level == 'ERROR':
+            line += 'user_id={} '.format(rnd.randint(1, 99999))
+        line += 'GET /api/v1/items/{} took {} ms\n'.format(
+            rnd.randint(1, 99999), rnd.randint(1, 999))
+        out.append(line)
+    return ''.join(out)
+
+
+def scan(finditer, compiled, text):
+    store = MatchStore(text, compiled.groups, compiled.groupindex)
+    append = store.append
+    for mo in finditer(text):
+        append(mo)
+    return store
+
+
+def best_time(func, repeat):
+    best = None
+    for i in range(repeat):
+        started = time.process_time()
+        func()
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv):
+    repeat = int(argv[0]) if argv else 3
+    text = make_log(LINES)
+    print('{:.1f} MB, {} lines, best of {}\n'.format(
+        len(text) / 1e6, LINES, repeat))
+    print('{:24} {:>8} {:>8} {:>8}  {}'.format(
+        'pattern', 'regex', 'filtered', 'speed-up', 'literal'))
+    for pattern in PATTERNS:
+        compiled = pattern_cache.get(pattern, 0)
+        plain = scan(compiled.regex.finditer, compiled, text)
+        filtered = scan(compiled.finditer, compiled, text)
+        assert plain.spans == filtered.spans, pattern
+        without = best_time(
+            lambda: scan(compiled.regex.finditer, compiled, text), repeat)
+        with_ = best_time(
+            lambda: scan(compiled.finditer, compiled, text), repeat)
+        print('{:24} {:7.3f}s {:7.3f}s {:7.1f}x  {!r}'.format(
+            pattern, without, with_, without / with_, compiled.required))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
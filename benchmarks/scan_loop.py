@@ -0,0 +1,85 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Overhead of the analyzer scan loop over a bare finditer() loop.
+
+    python benchmarks/scan_loop.py [REPEAT]
+
+Both loops append the same matches to a MatchStore, so the difference
+is the cost of progress reporting and of the stop flag. The best
+process time of REPEAT runs of each is compared; the exit status is 1
+if the overhead is above MAX_OVERHEAD.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'src'))
+
+from pyregs import engines
+from pyregs.analyzer import RegExAnalyzer, pattern_cache
+from pyregs.store import MatchStore
+
+PATTERN = r'a(b)'
+TEXT = 'ab ' * 300000
+MAX_OVERHEAD = 0.10
+
+
+def bare_loop():
+    compiled = pattern_cache.get(PATTERN, 0)
+    store = MatchStore(TEXT, compiled.groups, compiled.groupindex)
+    append = store.append
+    for mo in engines.get_engine(engines.BACKTRACKING).finditer(compiled,
+                                                               TEXT):
+        append(mo)
+    return len(store)
+
+
+def analyzer_loop():
+    anl = RegExAnalyzer(PATTERN, TEXT, cache=None)
+    anl.run()
+    return len(anl.matches)
+
+
+def best_time(func, repeat):
+    best = None
+    for i in range(repeat):
+        started = time.process_time()
+        func()
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv):
+    repeat = int(argv[0]) if argv else 15
+    assert bare_loop() == analyzer_loop()
+    bare = best_time(bare_loop, repeat)
+    analyzer = best_time(analyzer_loop, repeat)
+    overhead = analyzer / bare - 1
+    print('bare finditer loop  {:.3f} s'.format(bare))
+    print('analyzer scan loop  {:.3f} s'.format(analyzer))
+    print('overhead            {:+.1%} (at most {:.0%})'
+          .format(overhead, MAX_OVERHEAD))
+    return 1 if overhead > MAX_OVERHEAD else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1 +1,11 @@
-from .main_window import MainWindow
+# The GUI is imported on demand, so that the library interface
+# can be used without tkinter.
+from .api import analyze, iter_matches, AnalysisResult
+
+
+def __getattr__(name):
+    if name == 'MainWindow':
+        from .main_window import MainWindow
+        return MainWindow
+    raise AttributeError('module {!r} has no attribute {!r}'
+                         .format(__name__, name))
@@ -0,0 +1,162 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+"""asyncio interface of the analyzer:
+
+    async for start, end in analyze_async(pattern, text):
+        ...
+
+    result = await analyze_async(pattern, text)
+
+Every scan runs in a worker process (see ProcessRegExAnalyzer) within
+a time budget, driven by a thread of a small shared pool which only
+waits for it. Cancelling the task which awaits or iterates an analysis
+kills its worker, so a pattern which backtracks catastrophically holds
+neither a process nor a thread for longer than the budget.
+"""
+
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .api import AnalysisResult
+from .analyzer import (ProcessRegExAnalyzer, FINISHED_SUCCESS,
+                       FINISHED_TIMEOUT, pattern_cache)
+from . import engines
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def default_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=min(4, os.cpu_count() or 1),
+                thread_name_prefix='pyregs')
+        return _executor
+
+
+class AsyncAnalysis:
+    """A scan running in a worker process, see analyze_async().
+
+    Iterating it asynchronously yields the (start, end) spans of the
+    matches as they are found, awaiting it returns the AnalysisResult.
+    A scan which exceeds `timeout` seconds of wall-clock or CPU time
+    raises TimeoutError.
+    """
+    _DONE = object()
+
+    def __init__(self, pattern, text, flags=0, executor=None, timeout=10,
+                 engine=engines.BACKTRACKING):
+        pattern_cache.get(pattern, flags)
+        self.pattern = pattern
+        self.text = text
+        self.flags = flags
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        # matches are only queued while the analysis is iterated
+        self._iterating = False
+        self._sent = 0
+        self._analyzer = ProcessRegExAnalyzer(pattern, text, flags,
+                                              cache=None,
+                                              timeout=timeout,
+                                              cpu_timeout=timeout,
+                                              engine=engine)
+        self._analyzer.listener = self._on_progress
+        self._future = self._loop.run_in_executor(
+            executor or default_executor(), self._scan)
+
+    def cancel(self):
+        """Stops the scan, the result raises CancelledError."""
+        self._analyzer.stop()
+        self._future.cancel()
+
+    def _scan(self):
+        anl = self._analyzer
+        try:
+            anl.run()
+        finally:
+            self._publish(self._DONE)
+        if anl.state == FINISHED_TIMEOUT:
+            raise TimeoutError(anl.status)
+        if anl.state != FINISHED_SUCCESS:
+            # stopped, or an error in the pattern
+            raise RuntimeError(anl.status)
+        return AnalysisResult(self.pattern, self.text, self.flags,
+                              anl.matches)
+
+    def _on_progress(self, anl):
+        """Queues the spans of the matches received from the worker
+        since the previous call."""
+        if not self._iterating:
+            return
+        store = anl.matches
+        count = store.materialized
+        if count <= self._sent:
+            return
+        width = store.width
+        begin, end = self._sent * width, count * width
+        self._sent = count
+        self._publish(list(zip(store.spans[begin:end:width],
+                               store.spans[begin + 1:end:width])))
+
+    def _publish(self, item):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    async def __aiter__(self):
+        self._iterating = True
+        yielded = 0
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is self._DONE:
+                    break
+                for span in item:
+                    yield span
+                yielded += len(item)
+            # re-raises an exception of the scan, if any
+            result = await self._future
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+        # the matches found before the iteration started, or after
+        # the last progress message of the worker
+        matches = result.matches
+        for i in range(yielded, len(matches)):
+            yield matches[i].span()
+
+    async def result(self):
+        try:
+            return await asyncio.shield(self._future)
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+
+    def __await__(self):
+        return self.result().__await__()
+
+
+def analyze_async(pattern, text, flags=0, executor=None, timeout=10,
+                  engine=engines.BACKTRACKING):
+    """Starts an analysis in a worker process, driven from `executor`
+    (a shared thread pool by default), and returns an AsyncAnalysis.
+    Must be called from a coroutine. Invalid patterns raise re.error
+    right away.
+    """
+    return AsyncAnalysis(pattern, text, flags, executor, timeout, engine)
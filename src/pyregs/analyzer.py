@@ -15,74 +15,401 @@
 # You should have received a copy of the GNU General Public License
 # along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import re
+import mmap
+import time
+import signal
 import threading
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .store import MatchStore, PagedMatchStore
+from . import prefilter
+from . import linear
+from . import engines
+from .util import log
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
 
 IDLE = 0
 RUNNING = 1
 FINISHED_SUCCESS = 2
 FINISHED_ERROR = 3
+FINISHED_TIMEOUT = 4
+
+
+class CompiledPattern:
+    """A compiled regular expression together with the information
+    the analyzer needs about it. The parse tree is built on first access.
+    """
+    __slots__ = ('pattern', 'flags', 'regex', 'groups', 'groupindex',
+                 '_tree', '_required', '_linear', '_risks')
+
+    def __init__(self, pattern, flags):
+        self.pattern = pattern
+        self.flags = flags
+        self.regex = re.compile(pattern, flags)
+        self.groups = self.regex.groups
+        self.groupindex = dict(self.regex.groupindex)
+        self._tree = None
+        self._required = False
+        self._linear = None
+        self._risks = None
+
+    @property
+    def tree(self):
+        """The sre_parse tree of the pattern."""
+        if self._tree is None:
+            self._tree = sre_parse.parse(self.pattern, self.flags)
+        return self._tree
+
+    @property
+    def required(self):
+        """The prefilter.RequiredLiteral of the pattern, or None."""
+        if self._required is False:
+            self._required = prefilter.required_literal(self)
+        return self._required
+
+    @property
+    def linear(self):
+        """The linear.Matcher of the pattern, raises
+        linear.UnsupportedPattern if there can not be one."""
+        if self._linear is None:
+            try:
+                self._linear = linear.Matcher(linear.Program(self))
+            except linear.UnsupportedPattern as e:
+                # the reason is kept, the matcher is not built again
+                self._linear = str(e)
+        if isinstance(self._linear, str):
+            raise linear.UnsupportedPattern(self._linear)
+        return self._linear
+
+    @property
+    def risks(self):
+        """The redos.Risk objects of the pattern."""
+        if self._risks is None:
+            # imported here, redos depends on this module
+            from . import redos
+            self._risks = redos.analyze(self)
+        return self._risks
+
+    def finditer(self, text, pos=0):
+        """regex.finditer(text, pos), prefiltered if possible."""
+        if self.required is not None:
+            return prefilter.finditer(self.regex, text, self.required, pos)
+        return self.regex.finditer(text, pos)
+
+
+class PatternCache:
+    """A size-bounded LRU cache of CompiledPattern objects
+    keyed by (pattern, flags).
+
+    Unlike the internal cache of the re module it is not shared
+    with the rest of the process, so long patterns survive
+    flag toggling and undo/redo of pattern edits.
+    """
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, pattern, flags=0):
+        """Returns a CompiledPattern, raises re.error
+        if the pattern can not be compiled."""
+        key = (pattern, flags)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = CompiledPattern(pattern, flags)
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+pattern_cache = PatternCache()
+
+
+class MappedFile(mmap.mmap):
+    """A read-only memory map of a file.
+
+    Byte patterns run over it directly, without loading the file into
+    memory. It is pickled by path, so worker processes map the file
+    themselves instead of receiving a copy of its contents.
+    """
+    def __new__(cls, path):
+        with open(path, 'rb') as f:
+            self = mmap.mmap.__new__(cls, f.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+        self.path = path
+        return self
+
+    def __reduce__(self):
+        return (map_file, (self.path,))
+
+
+def map_file(path):
+    """Returns a MappedFile of the file at `path`,
+    or empty bytes if the file is empty (those can not be mapped)."""
+    if os.path.getsize(path) == 0:
+        return b''
+    return MappedFile(path)
+
+
+def result_key(pattern, text, flags=0):
+    """Result cache key: the pattern, flags and a content hash of the text.
+
+    Mapped files are identified by their path, size and modification
+    time instead of hashing the whole file.
+    """
+    if isinstance(text, MappedFile):
+        st = os.stat(text.path)
+        return (pattern, flags, (text.path, st.st_size, st.st_mtime_ns))
+    if isinstance(text, str):
+        text = text.encode('utf-8', 'surrogatepass')
+    import hashlib
+    return (pattern, flags, hashlib.blake2b(text).digest())
+
+
+class ResultCache:
+    """An LRU cache of detached MatchStore objects bounded by their total
+    size in bytes. Keys are produced by result_key().
+    """
+    def __init__(self, maxbytes=64 * 1024 * 1024):
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, result):
+        size = result.nbytes
+        if size > self.maxbytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._entries[key] = result
+            self.nbytes += size
+            while self.nbytes > self.maxbytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+result_cache = ResultCache()
+
 
 class RegExAnalyzer(threading.Thread):
-    def __init__(self, pattern='', text='', flags=0):
+    """Runs a regular expression over the text in a separate thread.
+
+    If `page_size` is given, the analyzer counts all matches but keeps
+    only a page of at most `page_size` matches in memory,
+    see PagedMatchStore.
+
+    `engine` is the name of the matching engine, see engines.py.
+
+    `listener`, if set, is called with the analyzer from the analyzer
+    thread whenever its state or status changes.
+    """
+    PROGRESS_BATCH = 64
+    PROGRESS_PERIOD = 0.1
+    def __init__(self, pattern='', text='', flags=0, cache=result_cache,
+                 page_size=None, checkpoint_interval=10000,
+                 engine=engines.BACKTRACKING):
         self._lock = threading.RLock()
-        self._stop_flag_lock = threading.Lock()
         self._status = ''
         self._state = IDLE
-        self._matches = []
+        self._matches = MatchStore(text)
         self._re_groups_count = 0
         self._re_groupindex = {}
+        self._risks = None
         self._stop_flag = False
 
+        self.listener = None
         self.pattern = pattern
         self.text = text
         self.flags = flags
+        self.cache = cache
+        self.page_size = page_size
+        self.checkpoint_interval = checkpoint_interval
+        self.engine = engine
         threading.Thread.__init__(self)
 
+    @classmethod
+    def from_cache(cls, pattern, text, flags=0, cache=result_cache):
+        """Returns an analyzer in FINISHED_SUCCESS state if the result
+        of the analysis is already cached, otherwise None."""
+        result = cache.get(result_key(pattern, text, flags))
+        if result is None:
+            return None
+        anl = cls(pattern, text, flags, cache=None)
+        anl._set_risks(pattern_cache.get(pattern, flags))
+        anl._re_groups_count = result.groups_count
+        anl._re_groupindex = result.groupindex
+        anl._matches = result.attach(text)
+        anl._set_success()
+        return anl
+
     def run(self, *args, **kwargs):
         self._set_state(RUNNING, 'Compiling...')
 
         try:
-            reo = re.compile(self.pattern, self.flags)
+            compiled = pattern_cache.get(self.pattern, self.flags)
         except Exception:
             self._set_state(FINISHED_ERROR,
                             'Error in regular expression pattern')
             return
+        self._set_risks(compiled)
+
+        engine = engines.get_engine(self.engine)
+        try:
+            engine.check(compiled)
+        except engines.UnsupportedPattern as e:
+            self._set_state(FINISHED_ERROR,
+                            'The {} engine can not run the pattern: {}'
+                            .format(engine.name, e))
+            return
 
         self._set_status('Analyzing (0%)')
 
-        text_len = len(self.text)
-        for mo in reo.finditer(self.text):
-            with self._lock:
-                self._matches.append(mo)
-                self._set_status('Analyzing ({:.1%})'.format(mo.start() / text_len))
-            # check whether we should continue at all
-            with self._stop_flag_lock:
-                if self._stop_flag == True:
-                    return
+        self._set_matches(self._make_store(compiled))
+        append = self._matches.append
+        # the first match is published right away
+        countdown = 1
+        next_report = time.monotonic()
+        for mo in self._finditer(compiled):
+            append(mo)
+            # the flag is only ever set to True, reading it needs no lock
+            if self._stop_flag:
+                return
+            # progress is published at most every PROGRESS_PERIOD seconds,
+            # the clock is looked at every PROGRESS_BATCH matches
+            countdown -= 1
+            if countdown == 0:
+                countdown = self.PROGRESS_BATCH
+                now = time.monotonic()
+                if now >= next_report:
+                    next_report = now + self.PROGRESS_PERIOD
+                    self._set_status('Analyzing ({:.1%})'
+                                     .format(self._progress(mo)))
 
-        mcount = len(self._matches)
-        self._re_groups_count = reo.groups
-        self._re_groupindex = reo.groupindex
+        self._re_groups_count = compiled.groups
+        self._re_groupindex = compiled.groupindex
+        self._cache_result()
+        self._set_success()
 
+    def _set_risks(self, compiled):
+        """Runs the static backtracking risk analysis of the pattern,
+        it takes a few milliseconds at most."""
+        risks = compiled.risks
+        with self._lock:
+            self._risks = risks
+        self._notify()
+
+    def _finditer(self, compiled):
+        """Returns the iterator of the matches of the CompiledPattern
+        in the text."""
+        return engines.get_engine(self.engine).finditer(compiled, self.text)
+
+    def _progress(self, mo):
+        """Returns the fraction of the text analyzed so far."""
+        if not self.text:
+            return 1.0
+        return mo.start() / len(self.text)
+
+    def _make_store(self, compiled):
+        if self.page_size is None:
+            return MatchStore(self.text, compiled.groups, compiled.groupindex)
+        return PagedMatchStore(self.text,
+                               compiled.groups,
+                               compiled.groupindex,
+                               regex=engines.get_engine(self.engine)
+                                            .scanner(compiled),
+                               page_size=self.page_size,
+                               checkpoint_interval=self.checkpoint_interval)
 
+    def _set_success(self):
+        mcount = len(self._matches)
+        engine = ''
+        if self.engine != engines.BACKTRACKING:
+            engine = ' by the {} engine'.format(self.engine)
         self._set_state(FINISHED_SUCCESS,
-                        'Analysis complete, {} {} found.'
-                        .format(mcount, ['match', 'matches'][mcount != 1]))
+                        'Analysis complete, {} {} found{}.'
+                        .format(mcount, ['match', 'matches'][mcount != 1],
+                                engine))
+
+    def _cache_result(self):
+        if self.cache is None:
+            return
+        self.cache.put(result_key(self.pattern, self.text, self.flags),
+                       self._matches.detach())
 
     def stop(self):
-        with self._stop_flag_lock:
-            self._stop_flag = True
+        self._stop_flag = True
 
     def _set_state(self, state, status=None):
         with self._lock:
             self._state = state
             if status is not None:
                 self._status = status
+        self._notify()
 
     def _set_status(self, status):
         with self._lock:
             self._status = status
+        self._notify()
+
+    def _notify(self):
+        listener = self.listener
+        if listener is not None:
+            listener(self)
 
     def _set_matches(self, matches):
         with self._lock:
@@ -101,6 +428,7 @@ class RegExAnalyzer(threading.Thread):
         * RUNNING
         * FINISHED_SUCCESS
         * FINISHED_ERROR
+        * FINISHED_TIMEOUT
         """
         with self._lock:
             return self._state
@@ -110,6 +438,20 @@ class RegExAnalyzer(threading.Thread):
         with self._lock:
             return self._matches
 
+    @property
+    def matches_available(self):
+        """The number of leading matches which can be accessed
+        while the analysis is still running."""
+        with self._lock:
+            return self._matches.materialized
+
+    @property
+    def risks(self):
+        """The redos.Risk objects of the pattern, None until
+        the pattern has been compiled."""
+        with self._lock:
+            return self._risks
+
     @property
     def re_groups_count(self):
         with self._lock:
@@ -122,3 +464,357 @@ class RegExAnalyzer(threading.Thread):
 
     def __del__(self):
         self.stop()
+
+
+
+class AnalysisWorker(threading.Thread):
+    """A long-lived thread which runs submitted analyzers one at a time.
+
+    Analyzers are run synchronously in the worker thread (they are never
+    start()-ed). Submitting an analyzer supersedes both the queued and
+    the running one: the queued analyzer is dropped and the running one
+    is stopped, so that at most one scan consumes CPU at any moment.
+    """
+    def __init__(self):
+        threading.Thread.__init__(self, daemon=True)
+        self._cond = threading.Condition()
+        self._pending = None
+        self._current = None
+        self._closed = False
+
+    def submit(self, anl):
+        with self._cond:
+            if self._current is not None:
+                self._current.stop()
+            anl._set_status('Waiting...')
+            self._pending = anl
+            self._cond.notify()
+
+    def cancel(self):
+        """Drop the queued analyzer and stop the running one."""
+        with self._cond:
+            if self._current is not None:
+                self._current.stop()
+            self._pending = None
+
+    def close(self):
+        with self._cond:
+            if self._current is not None:
+                self._current.stop()
+            self._pending = None
+            self._closed = True
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                anl, self._pending = self._pending, None
+                self._current = anl
+            try:
+                anl.run()
+            except Exception as e:
+                # the thread outlives any analyzer which fails
+                log.exception('Analysis of {!r} failed'.format(anl.pattern))
+                try:
+                    anl._set_state(FINISHED_ERROR,
+                                   'Analysis failed: {}'.format(e))
+                except Exception:
+                    log.exception('Reporting the failure failed')
+            finally:
+                with self._cond:
+                    self._current = None
+
+def _worker_main(conn):
+    """Entry point of a worker process: run analysis jobs received
+    through the connection until it is closed."""
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        options, cpu_timeout = job
+        _set_cpu_budget(cpu_timeout)
+        analyzer_class = options.pop('analyzer_class', RegExAnalyzer)
+        anl = analyzer_class(cache=None, **options)
+        anl.listener = _ProgressSender(conn)
+        anl.run()
+        _set_cpu_budget(None)
+        conn.send(('done',
+                   anl.state,
+                   anl.status,
+                   anl.re_groups_count,
+                   anl.re_groupindex,
+                   anl.matches.detach()))
+
+
+class _ProgressSender:
+    """Analyzer listener of a worker process: sends the status and
+    the spans of the matches found since the previous message."""
+    def __init__(self, conn):
+        self.conn = conn
+        self.store = None
+        self.sent = 0
+
+    def __call__(self, anl):
+        if anl.state != RUNNING:
+            return
+        store = anl.matches
+        if store is not self.store:
+            self.store = store
+            self.sent = 0
+        count = store.materialized * store.width
+        delta = store.spans[self.sent:count]
+        # an offset of 0 tells that the scan has started over
+        offset, self.sent = self.sent, count
+        self.conn.send(('progress',
+                        anl.status,
+                        store.groups_count,
+                        store.groupindex,
+                        offset,
+                        delta))
+
+
+def _set_cpu_budget(seconds):
+    """Limit CPU time of the current process to `seconds` from now.
+
+    The kernel sends SIGXCPU once the limit is exceeded, which
+    terminates the process. `None` lifts the limit.
+    """
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if seconds is None:
+        soft = hard
+    else:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime + seconds) + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+class _Worker:
+    def __init__(self):
+        # imported here to keep the module fast to import
+        import multiprocessing
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_main,
+                                               args=(child_conn,),
+                                               daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def kill(self):
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+
+
+class WorkerPool:
+    """A pool of reusable analyzer worker processes.
+
+    Unlike multiprocessing.Pool, a worker which runs away on a pattern
+    can be killed individually and is replaced with a fresh process
+    the next time a worker is requested.
+    """
+    def __init__(self, size=2):
+        self.size = size
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def acquire(self):
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive:
+                    return worker
+                worker.kill()
+        return _Worker()
+
+    def release(self, worker):
+        with self._lock:
+            if worker.alive and len(self._idle) < self.size:
+                self._idle.append(worker)
+                return
+        worker.kill()
+
+    def discard(self, worker):
+        worker.kill()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.kill()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def default_pool():
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = WorkerPool()
+        return _default_pool
+
+
+class ProcessRegExAnalyzer(RegExAnalyzer):
+    """RegExAnalyzer which runs the scan in a separate worker process.
+
+    A scan which exceeds `timeout` seconds of wall-clock time or
+    `cpu_timeout` seconds of CPU time is killed together with its
+    process and the analyzer finishes in FINISHED_TIMEOUT state.
+    Stopping the analyzer kills the worker as well, so a runaway
+    pattern never keeps a core busy after it has been abandoned.
+
+    Matches found by the worker are sent back while it is running,
+    so that they are available before the analysis finishes.
+
+    If the scan runs out of either budget and the pattern is supported
+    by `fallback_engine`, it is run again with that engine (and the same
+    budgets); `engine` is the engine of the last scan then.
+    """
+    POLL_PERIOD = 0.05
+
+    def __init__(self, pattern='', text='', flags=0, cache=result_cache,
+                 page_size=None, checkpoint_interval=10000,
+                 timeout=10, cpu_timeout=10, pool=None,
+                 engine=engines.BACKTRACKING, fallback_engine=None):
+        RegExAnalyzer.__init__(self, pattern, text, flags, cache,
+                               page_size, checkpoint_interval, engine)
+        self.timeout = timeout
+        self.cpu_timeout = cpu_timeout
+        self.pool = pool if pool is not None else default_pool()
+        self.fallback_engine = fallback_engine
+
+    def run(self, *args, **kwargs):
+        self._set_state(RUNNING, 'Analyzing...')
+        try:
+            # the risks are known before the worker has even started
+            self._set_risks(pattern_cache.get(self.pattern, self.flags))
+        except Exception:
+            # reported by the worker, e.g. re.error, or ValueError
+            # for incompatible flags
+            pass
+        reply, worker = self._scan()
+        if reply is None and self._can_fall_back(worker):
+            self._set_status('The {} engine ran out of time, '
+                             'analyzing with the {} engine...'
+                             .format(self.engine, self.fallback_engine))
+            self.engine = self.fallback_engine
+            reply, worker = self._scan()
+        if reply is None:
+            self._set_killed_state(worker)
+            return
+
+        _, state, status, groups_count, groupindex, matches = reply
+        with self._lock:
+            self._matches = matches.attach(self.text)
+            self._re_groups_count = groups_count
+            self._re_groupindex = groupindex
+        if state == FINISHED_SUCCESS:
+            self._cache_result()
+        self._set_state(state, status)
+
+    def _scan(self):
+        """Runs the analysis in a worker, returns its reply (None if
+        the worker has been killed) and the worker."""
+        self._timed_out = False
+        self._partial = None
+        worker = self.pool.acquire()
+        try:
+            worker.conn.send((self._job_options(), self.cpu_timeout))
+            reply = self._wait_reply(worker)
+        except (EOFError, OSError):
+            reply = None
+
+        if reply is None:
+            self.pool.discard(worker)
+        else:
+            self.pool.release(worker)
+        return reply, worker
+
+    def _can_fall_back(self, worker):
+        """Returns True if the killed scan ran out of a budget
+        and the fallback engine can run the pattern."""
+        if (self._stopped() or self.fallback_engine is None
+                or self.fallback_engine == self.engine):
+            return False
+        sigxcpu = getattr(signal, 'SIGXCPU', None)
+        if not (self._timed_out or (sigxcpu is not None
+                                    and worker.process.exitcode == -sigxcpu)):
+            return False
+        try:
+            compiled = pattern_cache.get(self.pattern, self.flags)
+            engines.get_engine(self.fallback_engine).check(compiled)
+        except (re.error, engines.UnsupportedPattern):
+            return False
+        return True
+
+    def _job_options(self):
+        """Keyword arguments of the RegExAnalyzer run by the worker."""
+        return dict(pattern=self.pattern,
+                    text=self.text,
+                    flags=self.flags,
+                    page_size=self.page_size,
+                    checkpoint_interval=self.checkpoint_interval,
+                    engine=self.engine)
+
+    def _wait_reply(self, worker):
+        """Wait for the worker to reply. Returns None if the analyzer
+        was stopped or the wall-clock budget has been exceeded."""
+        started = time.monotonic()
+        while not self._stopped():
+            if self.timeout is not None \
+               and time.monotonic() - started >= self.timeout:
+                self._timed_out = True
+                return None
+            if worker.conn.poll(self.POLL_PERIOD):
+                message = worker.conn.recv()
+                if message[0] != 'progress':
+                    return message
+                self._receive_progress(*message[1:])
+        return None
+
+    def _receive_progress(self, status, groups_count, groupindex, offset,
+                          delta):
+        if offset == 0 and self._partial is not None:
+            with self._lock:
+                del self._partial.spans[:]
+        if delta:
+            with self._lock:
+                if self._partial is None:
+                    # matches found so far, replaced by the final store
+                    self._partial = MatchStore(self.text, groups_count,
+                                               groupindex)
+                    self._matches = self._partial
+                self._partial.spans.extend(delta)
+        self._set_status(status)
+
+    def _set_killed_state(self, worker):
+        if self._stopped():
+            return
+        sigxcpu = getattr(signal, 'SIGXCPU', None)
+        if self._timed_out:
+            self._set_state(FINISHED_TIMEOUT,
+                            'Analysis timed out after {} s'
+                            .format(self.timeout))
+        elif sigxcpu is not None and worker.process.exitcode == -sigxcpu:
+            self._set_state(FINISHED_TIMEOUT,
+                            'Analysis exceeded CPU budget of {} s'
+                            .format(self.cpu_timeout))
+        else:
+            self._set_state(FINISHED_ERROR, 'Analyzer process crashed')
+
+    def _stopped(self):
+        return self._stop_flag
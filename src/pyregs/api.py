@@ -0,0 +1,127 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Library interface of the PyRegs analyzer.
+
+Nothing GUI-related is imported by this module:
+
+    >>> from pyregs import analyze
+    >>> result = analyze(r'(?P<key>\\w+)=(\\d+)', 'a=1 b=2')
+    >>> len(result)
+    2
+    >>> result[1].span(), result[1].groups()
+    ((4, 7), ('b', '2'))
+    >>> result.group_names()
+    ('key', 2)
+
+Invalid patterns raise re.error, like re.compile() does.
+"""
+
+from . import analyzer
+from .analyzer import pattern_cache, result_cache
+
+
+class AnalysisResult:
+    """The result of analyze().
+
+    A sequence of matches (MatchView objects offering start(), end(),
+    span(), group() and groups()), together with the information
+    about the pattern groups.
+    """
+    def __init__(self, pattern, text, flags, matches):
+        self.pattern = pattern
+        self.text = text
+        self.flags = flags
+        self.matches = matches
+
+    @property
+    def groups_count(self):
+        return self.matches.groups_count
+
+    @property
+    def groupindex(self):
+        """Maps group names to group numbers."""
+        return self.matches.groupindex
+
+    def group_names(self):
+        """Returns the names of groups 1..groups_count,
+        group numbers are used for unnamed groups."""
+        names = list(range(1, self.groups_count + 1))
+        for name, number in self.groupindex.items():
+            names[number - 1] = name
+        return tuple(names)
+
+    def spans(self):
+        """Returns the list of (start, end) spans of the matches."""
+        return [mo.span() for mo in self.matches]
+
+    def __len__(self):
+        return len(self.matches)
+
+    def __getitem__(self, index):
+        return self.matches[index]
+
+    def __iter__(self):
+        return iter(self.matches)
+
+    def __repr__(self):
+        return '<AnalysisResult pattern={!r} matches={}>'.format(
+            self.pattern, len(self))
+
+
+def analyze(pattern, text, flags=0, page_size=None, cache=result_cache,
+            engine='backtracking', parallel=False):
+    """Analyzes the text synchronously and returns an AnalysisResult.
+
+    If `page_size` is given, only a page of matches is kept in memory
+    at a time (see store.PagedMatchStore). Results are memoized
+    in `cache`, pass None to disable that. `engine` is 'backtracking'
+    (the re module) or 'linear', see engines.py.
+
+    With `parallel` True (or a number of processes), a large text is
+    split on line boundaries and scanned on several cores if the pattern
+    can not match across lines, see parallel.py. The scan then starts
+    a process pool, which a daemonic process (e.g. a multiprocessing.Pool
+    worker) is not allowed to do.
+    """
+    # raises re.error for invalid patterns
+    pattern_cache.get(pattern, flags)
+
+    anl = None
+    if cache is not None:
+        anl = analyzer.RegExAnalyzer.from_cache(pattern, text, flags, cache)
+    if anl is None and parallel:
+        # imported here, it imports multiprocessing
+        from .parallel import ParallelRegExAnalyzer
+        workers = None if parallel is True else parallel
+        anl = ParallelRegExAnalyzer(pattern, text, flags, workers=workers,
+                                    cache=cache, page_size=page_size,
+                                    engine=engine)
+        anl.run()
+    elif anl is None:
+        anl = analyzer.RegExAnalyzer(pattern, text, flags, cache=cache,
+                                     page_size=page_size, engine=engine)
+        anl.run()
+    if anl.state != analyzer.FINISHED_SUCCESS:
+        raise RuntimeError(anl.status)
+    return AnalysisResult(pattern, text, flags, anl.matches)
+
+
+def iter_matches(pattern, text, flags=0):
+    """Lazily yields the re match objects of the pattern in the text,
+    using the compiled pattern cache of the analyzer."""
+    return pattern_cache.get(pattern, flags).regex.finditer(text)
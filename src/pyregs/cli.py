@@ -0,0 +1,200 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Headless batch mode:
+
+    pyregs batch [-f FLAG]... [-o counts|spans|groups] [-p] PATTERN FILE|GLOB...
+
+Files are analyzed in parallel in a pool of processes, the results are
+printed as JSON lines in the order of the files. Every process writes
+the records of its file to a temporary file as it finds them, so memory
+does not grow with the number of matches. With --parallel, the
+files are analyzed one after another instead, each of them split on line
+boundaries and scanned on all the cores (see parallel.py), which suits
+a few large files better. Nothing in here imports tkinter.
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from . import api, stream
+from .analyzer import pattern_cache
+from .incremental import match_reach
+
+# the names of the flags in the Options tab
+FLAGS = ('ASCII', 'IGNORECASE', 'LOCALE', 'MULTILINE', 'DOTALL', 'VERBOSE')
+
+OUTPUT_COUNTS = 'counts'
+OUTPUT_SPANS = 'spans'
+OUTPUT_GROUPS = 'groups'
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='pyregs batch',
+        description='Analyze files with a regular expression '
+                    'and print the results as JSON lines.')
+    parser.add_argument('pattern')
+    parser.add_argument('files', nargs='+', metavar='file',
+                        help='file name or glob pattern')
+    parser.add_argument('-f', '--flag', action='append', default=[],
+                        choices=FLAGS, dest='flags',
+                        help='regular expression flag, may be repeated')
+    parser.add_argument('-o', '--output', default=OUTPUT_COUNTS,
+                        choices=(OUTPUT_COUNTS, OUTPUT_SPANS, OUTPUT_GROUPS))
+    parser.add_argument('-e', '--encoding', default='utf-8')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of processes (default: CPU count)')
+    parser.add_argument('-p', '--parallel', action='store_true',
+                        help='analyze one file at a time on all processes, '
+                             'for large files and line-oriented patterns')
+    return parser.parse_args(argv)
+
+
+def expand_files(names):
+    """Expands globs, names which match nothing are kept as they are
+    so that an error is reported for them."""
+    files = []
+    for name in names:
+        matched = sorted(glob.glob(name, recursive=True))
+        files.extend(matched if matched else [name])
+    return files
+
+
+def make_flags(names):
+    flags = 0
+    for name in names:
+        flags |= getattr(re, name)
+    return flags
+
+
+def analyze_file(path, pattern, flags, output, encoding):
+    """Yields the JSON-serializable records for the file as the matches
+    are found; a read or decoding error ends them with a record of it.
+
+    The file is read in chunks if the pattern allows it (see
+    stream.iter_matches()), otherwise as a whole."""
+    try:
+        compiled = pattern_cache.get(pattern, flags)
+        if _can_stream(compiled):
+            matches = stream.iter_file_matches(path, pattern, flags,
+                                               encoding)
+        else:
+            text = ''.join(stream.read_chunks(path, encoding))
+            matches = compiled.finditer(text)
+        if output == OUTPUT_COUNTS:
+            yield {'file': path, 'count': sum(1 for mo in matches)}
+        else:
+            yield from _records(path, pattern, flags, output, matches)
+    except (OSError, UnicodeError) as e:
+        yield {'file': path, 'error': str(e)}
+
+
+def _can_stream(compiled):
+    """Returns True if the matches of the pattern are found the same
+    in a stream of chunks as in the whole text: a match never looks
+    farther than the overlap of the chunks, and never behind or
+    at the end of the text."""
+    reach = match_reach(compiled)
+    return isinstance(reach, int) and reach < stream.OVERLAP
+
+
+def analyze_file_parallel(path, pattern, flags, output, encoding, jobs):
+    """Yields the JSON-serializable records for the file, which is read
+    into memory and scanned on `jobs` processes (None: CPU count)."""
+    try:
+        text = ''.join(stream.read_chunks(path, encoding))
+    except (OSError, UnicodeError) as e:
+        yield {'file': path, 'error': str(e)}
+        return
+    result = api.analyze(pattern, text, flags, cache=None,
+                         parallel=jobs or True)
+    if output == OUTPUT_COUNTS:
+        yield {'file': path, 'count': len(result)}
+    else:
+        yield from _records(path, pattern, flags, output, result)
+
+
+def _records(path, pattern, flags, output, matches):
+    groupindex = pattern_cache.get(pattern, flags).groupindex
+    for mo in matches:
+        record = {'file': path, 'span': mo.span()}
+        if output == OUTPUT_GROUPS:
+            record['groups'] = mo.groups()
+            record['named'] = {name: mo.group(number)
+                               for name, number in groupindex.items()}
+        yield record
+
+
+def _analyze_file(args):
+    """Writes the JSON lines of a file to a temporary file in a pool
+    process, so that no process holds all the records of the file.
+    Returns the name of the temporary file and whether an error has been
+    reported."""
+    failed = False
+    with tempfile.NamedTemporaryFile('w', suffix='.jsonl',
+                                     delete=False) as f:
+        for record in analyze_file(*args):
+            failed = failed or 'error' in record
+            f.write(json.dumps(record) + '\n')
+    return f.name, failed
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    flags = make_flags(args.flags)
+    try:
+        pattern_cache.get(args.pattern, flags)
+    except (re.error, ValueError) as e:
+        print('Error in regular expression pattern: {}'.format(e),
+              file=sys.stderr)
+        return 2
+
+    files = expand_files(args.files)
+    jobs = [(path, args.pattern, flags, args.output, args.encoding)
+            for path in files]
+    if args.parallel:
+        return _print_records(analyze_file_parallel(*job, jobs=args.jobs)
+                              for job in jobs)
+    failed = False
+    with ProcessPoolExecutor(args.jobs) as executor:
+        # the output of every file is copied in the order of the files
+        for name, file_failed in executor.map(_analyze_file, jobs):
+            failed = failed or file_failed
+            try:
+                with open(name) as f:
+                    shutil.copyfileobj(f, sys.stdout)
+            finally:
+                os.remove(name)
+    return 1 if failed else 0
+
+
+def _print_records(results):
+    """Prints the records of every file, returns the exit status."""
+    failed = False
+    for records in results:
+        for record in records:
+            failed = failed or 'error' in record
+            print(json.dumps(record))
+    return 1 if failed else 0
@@ -0,0 +1,101 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Matching engines of the analyzer.
+
+An engine finds the matches of a CompiledPattern in a text, the same
+matches as re.finditer() would. The backtracking engine runs the re
+module; the linear one (see linear.py) never backtracks: a search for
+the next match takes time linear in the length of the text whatever
+the pattern, so finding all the matches takes at most quadratic time
+(e.g. x.*y|x over a run of x, where every search reads up to the end
+of the text), never exponential. It runs patterns without
+backreferences and lookarounds only, and is much slower on patterns
+which do not backtrack catastrophically.
+"""
+
+from .linear import UnsupportedPattern
+
+BACKTRACKING = 'backtracking'
+LINEAR = 'linear'
+
+
+class Engine:
+    name = None
+
+    def check(self, compiled):
+        """Raises UnsupportedPattern if the engine can not run
+        the pattern."""
+
+    def finditer(self, compiled, text, pos=0):
+        raise NotImplementedError
+
+    def scanner(self, compiled):
+        """Returns a picklable object with a finditer(text, pos) method
+        running the engine, for stores which re-scan the text."""
+        raise NotImplementedError
+
+
+class BacktrackingEngine(Engine):
+    name = BACKTRACKING
+
+    def finditer(self, compiled, text, pos=0):
+        return compiled.finditer(text, pos)
+
+    def scanner(self, compiled):
+        return compiled.regex
+
+
+class LinearEngine(Engine):
+    name = LINEAR
+
+    def check(self, compiled):
+        compiled.linear
+
+    def finditer(self, compiled, text, pos=0):
+        return compiled.linear.finditer(text, pos)
+
+    def scanner(self, compiled):
+        self.check(compiled)
+        return _LinearScanner(compiled.pattern, compiled.flags)
+
+
+class _LinearScanner:
+    """Runs the linear engine; pickled as the pattern and flags only,
+    the matcher is taken from the pattern cache of the process."""
+    def __init__(self, pattern, flags):
+        self.pattern = pattern
+        self.flags = flags
+
+    def finditer(self, text, pos=0):
+        from .analyzer import pattern_cache
+        compiled = pattern_cache.get(self.pattern, self.flags)
+        return compiled.linear.finditer(text, pos)
+
+
+ENGINES = {engine.name: engine
+           for engine in (BacktrackingEngine(), LinearEngine())}
+
+
+def get_engine(name):
+    """Returns the engine called `name`, raises ValueError
+    for unknown names."""
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ValueError('unknown engine: {!r}'.format(name)) from None
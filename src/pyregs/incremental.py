@@ -0,0 +1,338 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Incremental re-analysis of an edited text.
+
+After an edit, the matches found before the edited range are kept
+as long as the scan which found them could not have looked at it,
+the text is re-scanned from there, and as soon as a new match past the
+edited range equals an old one, the rest of the old matches is reused
+with shifted offsets.
+"""
+
+import re
+from array import array
+
+try:
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_constants
+
+from .analyzer import (RegExAnalyzer, ProcessRegExAnalyzer, FINISHED_SUCCESS,
+                       pattern_cache)
+from .store import MatchStore
+from .parallel import can_split_lines
+from . import engines
+
+# texts are compared in blocks of this size
+_BLOCK = 64 * 1024
+
+
+def common_prefix(a, b):
+    """Returns the length of the common prefix of two strings."""
+    size = min(len(a), len(b))
+    pos = 0
+    while pos < size and a[pos:pos + _BLOCK] == b[pos:pos + _BLOCK]:
+        pos += _BLOCK
+    end = min(pos + _BLOCK, size)
+    while pos < end and a[pos] == b[pos]:
+        pos += 1
+    return pos
+
+
+def common_suffix(a, b, limit):
+    """Returns the length of the common suffix of two strings,
+    `limit` at most."""
+    la, lb = len(a), len(b)
+    size = 0
+    while (size + _BLOCK <= limit
+           and a[la - size - _BLOCK:la - size]
+               == b[lb - size - _BLOCK:lb - size]):
+        size += _BLOCK
+    end = min(size + _BLOCK, limit)
+    while size < end and a[la - size - 1] == b[lb - size - 1]:
+        size += 1
+    return size
+
+
+def match_reach(compiled):
+    """Returns how far past its start position an attempt to match the
+    pattern (a CompiledPattern) may look at the text: a number
+    of characters, '\\n' if it never looks past the end of the line,
+    or None if it may depend on text before its start position
+    (lookbehinds) or on the length of the text (\\Z, $ without
+    MULTILINE). Lookaheads are not supported either.
+    """
+    if not _is_local(compiled.tree, compiled.regex.flags):
+        return None
+    lo, hi = compiled.tree.getwidth()
+    if hi < sre_constants.MAXREPEAT:
+        # one more character is looked at by \b and $ at the end
+        return hi + 1
+    if can_split_lines(compiled):
+        return '\n'
+    return None
+
+
+_REPEATS = tuple(getattr(sre_constants, name)
+                 for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+                 if hasattr(sre_constants, name))
+
+
+def _is_local(subpattern, flags):
+    c = sre_constants
+    for op, av in subpattern:
+        if op in (c.ASSERT, c.ASSERT_NOT):
+            return False
+        elif op is c.AT:
+            if av is c.AT_END_STRING:
+                return False
+            if av is c.AT_END and not flags & re.MULTILINE:
+                return False
+        elif op is c.BRANCH:
+            if not all(_is_local(p, flags) for p in av[1]):
+                return False
+        elif op is c.SUBPATTERN:
+            group, add_flags, del_flags, p = av
+            if not _is_local(p, (flags | add_flags) & ~del_flags):
+                return False
+        elif op in _REPEATS:
+            if not _is_local(av[2], flags):
+                return False
+        elif op is c.GROUPREF_EXISTS:
+            group, yes, no = av
+            if not _is_local(yes, flags):
+                return False
+            if no is not None and not _is_local(no, flags):
+                return False
+        elif op is getattr(c, 'ATOMIC_GROUP', None):
+            if not _is_local(av, flags):
+                return False
+    return True
+
+
+class ResumePlan:
+    """How an incremental analysis reuses the result of the previous one:
+    `old` are its matches (detached from the old text), the scan resumes
+    at the `keep`-th one, whose regs are `resume` (None to scan from the
+    start), the offsets after the edit are moved by `delta`, and
+    the unchanged suffix starts at `resync` - 1.
+
+    It is made where the old text is at hand and pickled to the worker
+    process which runs the scan.
+    """
+    __slots__ = ('old', 'keep', 'resume', 'delta', 'resync')
+
+    def __init__(self, old, keep, resume, delta, resync):
+        self.old = old
+        self.keep = keep
+        self.resume = resume
+        self.delta = delta
+        self.resync = resync
+
+
+class _PageOverflow(Exception):
+    pass
+
+
+class IncrementalRegExAnalyzer(RegExAnalyzer):
+    """RegExAnalyzer which reuses the result of `previous`, a finished
+    analysis of the same pattern over an earlier version of the text,
+    or follows a ResumePlan made from it.
+
+    Falls back to a full scan if the pattern or the previous result
+    do not allow an incremental one, see can_resume(), or if the result
+    would have more than `page_size` matches, which are then paged.
+    `incremental` tells which of the two happened.
+    """
+    def __init__(self, pattern='', text='', flags=0, previous=None,
+                 plan=None, **kwargs):
+        RegExAnalyzer.__init__(self, pattern, text, flags, **kwargs)
+        self.previous = previous
+        self.plan = plan
+        self.incremental = False
+        self.rescanned = 0
+        self._full_scan = False
+
+    @classmethod
+    def can_resume(cls, previous, pattern, text, flags=0):
+        """Returns True if an analysis of `text` can reuse the result
+        of the `previous` analyzer."""
+        if previous is None or previous.state != FINISHED_SUCCESS:
+            return False
+        if (previous.pattern != pattern or previous.flags != flags
+                or type(previous.text) is not type(text)
+                or not isinstance(text, (str, bytes))):
+            return False
+        matches = previous.matches
+        # every old match has to be at hand
+        if (not isinstance(matches, MatchStore)
+                or matches.materialized != len(matches)):
+            return False
+        try:
+            compiled = pattern_cache.get(pattern, flags)
+        except re.error:
+            return False
+        return match_reach(compiled) is not None
+
+    @classmethod
+    def make_plan(cls, previous, pattern, text, flags=0):
+        """Returns the ResumePlan of an analysis of `text` reusing
+        the result of `previous`, or None if can_resume() is False."""
+        if not cls.can_resume(previous, pattern, text, flags):
+            return None
+        compiled = pattern_cache.get(pattern, flags)
+        old_text = previous.text
+        old = previous.matches
+        reach = match_reach(compiled)
+
+        prefix = common_prefix(old_text, text)
+        suffix = common_suffix(old_text, text,
+                               min(len(old_text), len(text)) - prefix)
+        # matches starting before `safe` have been found by attempts
+        # which looked at the unchanged prefix only
+        if reach == '\n':
+            safe = text.rfind('\n' if isinstance(text, str) else b'\n',
+                              0, prefix) + 1
+        else:
+            safe = prefix - reach + 1
+        keep = old.bisect_end(safe)
+        while keep < len(old) and old[keep].start() < safe:
+            keep += 1
+
+        # the last kept match is found again to resume the scan
+        # in the state it left the scanner in
+        resume = None
+        if keep > 0:
+            keep -= 1
+            resume = old[keep].regs
+        # a new match starting at or after `resync` is only looked for
+        # in the unchanged suffix (and the character before it)
+        return ResumePlan(old.detach(), keep, resume,
+                          len(text) - len(old_text),
+                          len(text) - suffix + 1)
+
+    def run(self, *args, **kwargs):
+        try:
+            RegExAnalyzer.run(self, *args, **kwargs)
+        except _PageOverflow:
+            # the result does not fit a page, so it is not kept whole
+            self._full_scan = True
+            RegExAnalyzer.run(self, *args, **kwargs)
+
+    def _make_store(self, compiled):
+        if self.plan is None and not self._full_scan:
+            self.plan = self.make_plan(self.previous, self.pattern,
+                                       self.text, self.flags)
+        self.incremental = self.plan is not None and not self._full_scan
+        if not self.incremental:
+            return RegExAnalyzer._make_store(self, compiled)
+        plan = self.plan
+        return MatchStore(self.text, compiled.groups, compiled.groupindex,
+                          spans=plan.old.spans[:plan.keep * plan.old.width])
+
+    def _finditer(self, compiled):
+        if not self.incremental:
+            return RegExAnalyzer._finditer(self, compiled)
+        return self._rescan(compiled)
+
+    def _rescan(self, compiled):
+        plan = self.plan
+        old = plan.old
+        resume = plan.resume
+        start = resume[0][0] if resume is not None else 0
+        count = plan.keep
+        engine = engines.get_engine(self.engine)
+        for mo in engine.finditer(compiled, self.text, start):
+            if resume is not None:
+                # skip empty matches which preceded the resumed one
+                if mo.regs == resume or mo.start() > resume[0][0]:
+                    resume = None
+                    count = self._check_page(count + 1)
+                    yield mo
+                continue
+            if mo.start() >= plan.resync:
+                index = self._find_old(old, mo, plan.delta)
+                if index is not None:
+                    self._check_page(count + len(old) - index)
+                    self._splice(old, index, plan.delta)
+                    return
+            self.rescanned = mo.end() - start
+            count = self._check_page(count + 1)
+            yield mo
+        self.rescanned = len(self.text) - start
+
+    def _check_page(self, count):
+        """Returns `count`, raises _PageOverflow if the result would
+        have more than page_size matches."""
+        if self.page_size is not None and count > self.page_size:
+            raise _PageOverflow()
+        return count
+
+    @staticmethod
+    def _find_old(old, mo, delta):
+        """Returns the index of the old match equal to `mo`
+        moved by `delta`, or None."""
+        start = mo.start() - delta
+        regs = tuple((s - delta, e - delta) if s != -1 else (s, e)
+                     for s, e in mo.regs)
+        index = old.bisect_end(start)
+        while index < len(old) and old[index].start() <= start:
+            if old[index].regs == regs:
+                return index
+            index += 1
+        return None
+
+    def _splice(self, old, index, delta):
+        """Appends the old matches from `index` on, moved by `delta`."""
+        tail = old.spans[index * old.width:]
+        if delta:
+            tail = array('q', [v + delta if v != -1 else v for v in tail])
+        self._matches.spans.extend(tail)
+
+
+class ProcessIncrementalRegExAnalyzer(ProcessRegExAnalyzer):
+    """ProcessRegExAnalyzer which runs an IncrementalRegExAnalyzer
+    in the worker process, with the same budgets as a full scan:
+    the re-scanned part of an edited text may take as long as
+    the whole of it.
+
+    The ResumePlan is made from `previous` before the scan starts.
+    """
+    def __init__(self, pattern='', text='', flags=0, previous=None,
+                 **kwargs):
+        ProcessRegExAnalyzer.__init__(self, pattern, text, flags, **kwargs)
+        self.previous = previous
+        self.plan = None
+
+    def run(self, *args, **kwargs):
+        try:
+            self.plan = IncrementalRegExAnalyzer.make_plan(
+                self.previous, self.pattern, self.text, self.flags)
+        except re.error:
+            # reported by the worker
+            pass
+        # the old text and matches are not needed any longer
+        self.previous = None
+        ProcessRegExAnalyzer.run(self, *args, **kwargs)
+
+    def _job_options(self):
+        options = ProcessRegExAnalyzer._job_options(self)
+        if self.plan is not None:
+            options.update(analyzer_class=IncrementalRegExAnalyzer,
+                           plan=self.plan)
+        return options
@@ -0,0 +1,632 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A matcher which searches in linear time, for patterns without
+backreferences and lookarounds.
+
+The parse tree of a pattern is compiled into a program of a Thompson
+NFA. A search runs a lazily built DFA forward to find where the leftmost
+match ends, a DFA of the reversed pattern backwards to find where it
+starts, and a Pike VM over the match only to find its groups. No text
+position is examined more than a fixed number of times per search,
+however the pattern would backtrack in the re module.
+
+A search may read past the end of the match it finds, as far as
+a longer match could reach, and finditer() runs a search per match.
+Finding all the matches is therefore quadratic in the worst case,
+e.g. for x.*y|x over a run of x, as in other automata based engines.
+
+The matches and groups are the same as those of the re module: DFA
+states are ordered lists of NFA threads (as in RE2) to keep
+the leftmost-first preference of alternatives and quantifiers, and
+a repetition stops after an optional iteration which matched the empty
+string, like in sre.
+"""
+
+import re
+
+try:
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_constants
+
+
+class UnsupportedPattern(ValueError):
+    """Raised for patterns which the linear engine can not run."""
+
+
+# instructions
+CHAR = 0        # (CHAR, test): consume a character for which test(code)
+SPLIT = 1       # (SPLIT, x, y): continue at x, then (less preferred) at y
+JMP = 2         # (JMP, x)
+SAVE = 3        # (SAVE, slot): record the position in a group slot
+ASSERT = 4      # (ASSERT, test): test(text, pos) is true
+LOOP = 5        # (LOOP, loop): an iteration of a loop starts
+UNTIL = 6       # (UNTIL, loop, x, y): an iteration ends, continue at x,
+                # or at y if the iteration matched the empty string
+MATCH = 7
+
+# programs larger than this are not built
+MAX_PROGRAM = 20000
+# lazily built DFA states are dropped when there are more than this
+MAX_STATES = 4096
+
+_c = sre_constants
+_REPEATS = tuple(getattr(_c, name)
+                 for name in ('MAX_REPEAT', 'MIN_REPEAT')
+                 if hasattr(_c, name))
+_UNSUPPORTED = {
+    _c.GROUPREF: 'backreferences',
+    _c.GROUPREF_EXISTS: 'conditional groups',
+    _c.ASSERT: 'lookarounds',
+    _c.ASSERT_NOT: 'lookarounds',
+}
+for _name in ('ATOMIC_GROUP', 'POSSESSIVE_REPEAT'):
+    if hasattr(_c, _name):
+        _UNSUPPORTED[getattr(_c, _name)] = 'atomic groups'
+
+_NEWLINE = ord('\n')
+_ASCII_SPACE = frozenset(map(ord, ' \t\n\r\f\v'))
+
+
+def _ascii_digit(code):
+    return 48 <= code <= 57
+
+
+def _ascii_word(code):
+    return (48 <= code <= 57 or 65 <= code <= 90 or 97 <= code <= 122
+            or code == 95)
+
+
+def _uni_digit(code):
+    return chr(code).isdecimal()
+
+
+def _uni_word(code):
+    return code == 95 or chr(code).isalnum()
+
+
+def _uni_space(code):
+    return chr(code).isspace()
+
+
+def _categories(unicode):
+    if unicode:
+        digit, word, space = _uni_digit, _uni_word, _uni_space
+    else:
+        digit, word, space = _ascii_digit, _ascii_word, \
+            _ASCII_SPACE.__contains__
+    linebreak = _NEWLINE.__eq__
+    return {
+        _c.CATEGORY_DIGIT: digit,
+        _c.CATEGORY_NOT_DIGIT: lambda code: not digit(code),
+        _c.CATEGORY_WORD: word,
+        _c.CATEGORY_NOT_WORD: lambda code: not word(code),
+        _c.CATEGORY_SPACE: space,
+        _c.CATEGORY_NOT_SPACE: lambda code: not space(code),
+        _c.CATEGORY_LINEBREAK: linebreak,
+        _c.CATEGORY_NOT_LINEBREAK: lambda code: code != _NEWLINE,
+    }
+
+
+def _code(text, pos):
+    ch = text[pos]
+    return ch if isinstance(ch, int) else ord(ch)
+
+
+class Program:
+    """A compiled pattern: the forward program with group slots, and
+    the program of the reversed pattern used to find match starts."""
+    def __init__(self, compiled):
+        flags = compiled.regex.flags
+        if flags & (re.IGNORECASE | re.LOCALE):
+            raise UnsupportedPattern('case-insensitive and locale-aware '
+                                     'patterns are not supported')
+        self.groups = compiled.groups
+        unicode = bool(flags & re.UNICODE)
+        self.forward = _Builder(unicode, reverse=False).build(
+            compiled.tree, flags)
+        self.reverse = _Builder(unicode, reverse=True).build(
+            compiled.tree, flags)
+        self.loops = self.forward.loops
+
+
+class _Code:
+    """Instructions of a program and some facts about them."""
+    def __init__(self, instructions, loops):
+        self.instructions = instructions
+        self.loops = loops
+        self.has_asserts = any(i[0] == ASSERT for i in instructions)
+
+
+class _Builder:
+    def __init__(self, unicode, reverse):
+        self.categories = _categories(unicode)
+        self.word = self.categories[_c.CATEGORY_WORD]
+        self.reverse = reverse
+        self.code = []
+        self.loops = 0
+
+    def build(self, tree, flags):
+        if not self.reverse:
+            self.emit(SAVE, 0)
+        self.sequence(tree, flags)
+        if not self.reverse:
+            self.emit(SAVE, 1)
+        self.emit(MATCH)
+        return _Code(self.code, self.loops)
+
+    def emit(self, *instruction):
+        if len(self.code) >= MAX_PROGRAM:
+            raise UnsupportedPattern('the pattern is too large')
+        self.code.append(list(instruction))
+        return len(self.code) - 1
+
+    def sequence(self, subpattern, flags):
+        nodes = list(subpattern)
+        if self.reverse:
+            nodes.reverse()
+        for op, av in nodes:
+            self.node(op, av, flags)
+
+    def node(self, op, av, flags):
+        if op in _UNSUPPORTED:
+            raise UnsupportedPattern('{} are not supported'
+                                     .format(_UNSUPPORTED[op]))
+        if op is _c.LITERAL:
+            self.emit(CHAR, av.__eq__)
+        elif op is _c.NOT_LITERAL:
+            self.emit(CHAR, av.__ne__)
+        elif op is _c.ANY:
+            if flags & re.DOTALL:
+                self.emit(CHAR, lambda code: True)
+            else:
+                self.emit(CHAR, lambda code: code != _NEWLINE)
+        elif op is _c.IN:
+            self.emit(CHAR, self.charset(av))
+        elif op is _c.AT:
+            self.emit(ASSERT, self.anchor(av, flags))
+        elif op is _c.BRANCH:
+            self.branch(av[1], flags)
+        elif op is _c.SUBPATTERN:
+            group, add_flags, del_flags, p = av
+            if add_flags & (re.IGNORECASE | re.LOCALE):
+                raise UnsupportedPattern('case-insensitive groups '
+                                         'are not supported')
+            flags = (flags | add_flags) & ~del_flags
+            if group is not None and not self.reverse:
+                self.emit(SAVE, group * 2)
+            self.sequence(p, flags)
+            if group is not None and not self.reverse:
+                self.emit(SAVE, group * 2 + 1)
+        elif op in _REPEATS:
+            self.repeat(op is _c.MAX_REPEAT, av, flags)
+        else:
+            raise UnsupportedPattern('{} is not supported'.format(op))
+
+    def branch(self, alternatives, flags):
+        jumps = []
+        for i, alternative in enumerate(alternatives):
+            if i < len(alternatives) - 1:
+                split = self.emit(SPLIT, None, None)
+                self.code[split][1] = len(self.code)
+                self.sequence(alternative, flags)
+                jumps.append(self.emit(JMP, None))
+                self.code[split][2] = len(self.code)
+            else:
+                self.sequence(alternative, flags)
+        for jump in jumps:
+            self.code[jump][1] = len(self.code)
+
+    def repeat(self, greedy, av, flags):
+        lo, hi, body = av
+        if hi == lo:
+            for _ in range(lo):
+                self.sequence(body, flags)
+            return
+
+        # an optional iteration which matches the empty string ends the
+        # repetition, like the zero-width match protection of sre; bodies
+        # which can not match it need no bookkeeping, neither does the
+        # reversed program which is only used to find match starts
+        nullable = body.getwidth()[0] == 0 and not self.reverse
+        loop = self.loops
+        if nullable:
+            self.loops += 1
+        # instruction slots to point to the end of the repetition
+        exits = []
+
+        def iteration(continue_at=None):
+            """Emits an iteration, continuing at `continue_at`
+            (the next instruction by default) if it is not empty."""
+            if nullable:
+                self.emit(LOOP, loop)
+            self.sequence(body, flags)
+            if nullable:
+                until = self.emit(UNTIL, loop, continue_at, None)
+                if continue_at is None:
+                    self.code[until][2] = until + 1
+                exits.append((until, 3))
+            elif continue_at is not None:
+                self.emit(JMP, continue_at)
+
+        def split(preferred):
+            index = self.emit(SPLIT, None, None)
+            self.code[index][1 if greedy else 2] = preferred
+            exits.append((index, 2 if greedy else 1))
+            return index
+
+        for _ in range(lo):
+            self.sequence(body, flags)
+        if hi == _c.MAXREPEAT:
+            # L: SPLIT(body, end); body; continue at L
+            index = split(len(self.code) + 1)
+            iteration(index)
+        else:
+            for _ in range(hi - lo):
+                split(len(self.code) + 1)
+                iteration()
+        end = len(self.code)
+        for index, slot in exits:
+            self.code[index][slot] = end
+
+    def charset(self, items):
+        negate = False
+        literals = set()
+        ranges = []
+        tests = []
+        for op, av in items:
+            if op is _c.NEGATE:
+                negate = True
+            elif op is _c.LITERAL:
+                literals.add(av)
+            elif op is _c.RANGE:
+                ranges.append(av)
+            elif op is _c.CATEGORY:
+                tests.append(self.categories[av])
+            else:
+                raise UnsupportedPattern('{} is not supported in sets'
+                                         .format(op))
+        literals = frozenset(literals)
+
+        def test(code):
+            found = (code in literals
+                     or any(lo <= code <= hi for lo, hi in ranges)
+                     or any(t(code) for t in tests))
+            return found != negate
+        return test
+
+    def anchor(self, at, flags):
+        word = self.word
+        if at is _c.AT_BEGINNING and flags & re.MULTILINE:
+            at = _c.AT_BEGINNING_LINE
+        elif at is _c.AT_END and flags & re.MULTILINE:
+            at = _c.AT_END_LINE
+
+        if at in (_c.AT_BEGINNING, _c.AT_BEGINNING_STRING):
+            return lambda text, pos: pos == 0
+        if at is _c.AT_BEGINNING_LINE:
+            return lambda text, pos: (pos == 0
+                                      or _code(text, pos - 1) == _NEWLINE)
+        if at is _c.AT_END:
+            return lambda text, pos: (pos == len(text)
+                                      or (pos == len(text) - 1
+                                          and _code(text, pos) == _NEWLINE))
+        if at is _c.AT_END_LINE:
+            return lambda text, pos: (pos == len(text)
+                                      or _code(text, pos) == _NEWLINE)
+        if at is _c.AT_END_STRING:
+            return lambda text, pos: pos == len(text)
+
+        def is_word(text, pos):
+            return 0 <= pos < len(text) and word(_code(text, pos))
+
+        if at is _c.AT_BOUNDARY:
+            return lambda text, pos: (len(text) > 0 and is_word(text, pos - 1)
+                                      != is_word(text, pos))
+        if at is _c.AT_NON_BOUNDARY:
+            return lambda text, pos: (len(text) > 0 and is_word(text, pos - 1)
+                                      == is_word(text, pos))
+        raise UnsupportedPattern('{} is not supported'.format(at))
+
+
+class _State:
+    """A state of a lazily built DFA: the ordered NFA threads waiting
+    for a character."""
+    __slots__ = ('pcs', 'matched', 'searching', 'next')
+
+    def __init__(self, pcs, matched, searching):
+        self.pcs = pcs
+        self.matched = matched
+        self.searching = searching
+        self.next = {}
+
+
+class _DFA:
+    """A DFA of a program built on the fly. Forward DFAs keep the order
+    of the threads and cut those less preferred than a match, reverse
+    ones look for the longest match."""
+    def __init__(self, code, longest):
+        self.code = code.instructions
+        self.longest = longest
+        self.asserts = [pc for pc, ins in enumerate(self.code)
+                        if ins[0] == ASSERT]
+        self._assert_index = {pc: i for i, pc in enumerate(self.asserts)}
+        self._states = {}
+        self._starts = {}
+
+    def context(self, text, pos):
+        """The results of the assertions of the program at `pos`."""
+        code = self.code
+        return tuple(code[pc][1](text, pos) for pc in self.asserts)
+
+    def _intern(self, pcs, matched, searching):
+        key = (pcs, matched, searching)
+        state = self._states.get(key)
+        if state is None:
+            if len(self._states) >= MAX_STATES:
+                # keeps the memory bounded, states are rebuilt as needed
+                self._states = {}
+                self._starts = {}
+            state = self._states[key] = _State(pcs, matched, searching)
+        return state
+
+    def start(self, text, pos, searching):
+        ctx = self.context(text, pos) if self.asserts else None
+        key = (ctx, searching)
+        state = self._starts.get(key)
+        if state is None:
+            if self.longest:
+                state = self._closure((0,), ctx, False)
+            else:
+                state = self._closure((), ctx, searching)
+            self._starts[key] = state
+        return state
+
+    def step(self, state, ch, text, pos):
+        """Returns the state after consuming `ch`, `pos` being
+        the position after it."""
+        if self.asserts:
+            ctx = self.context(text, pos)
+            key = (ch, ctx)
+        else:
+            ctx = None
+            key = ch
+        following = state.next.get(key)
+        if following is None:
+            code = self.code
+            char = ch if isinstance(ch, int) else ord(ch)
+            kernel = tuple(pc + 1 for pc in state.pcs if code[pc][1](char))
+            following = state.next[key] = self._closure(kernel, ctx,
+                                                        state.searching)
+        return following
+
+    def _closure(self, kernel, ctx, searching):
+        code = self.code
+        pcs = []
+        seen = set()
+        matched = False
+        sources = kernel + (0,) if searching else kernel
+        for source in sources:
+            stack = [(source, 0)]
+            while stack:
+                pc, mask = stack.pop()
+                ins = code[pc]
+                op = ins[0]
+                if op == CHAR:
+                    if pc not in seen:
+                        seen.add(pc)
+                        pcs.append(pc)
+                    continue
+                if op == MATCH:
+                    matched = True
+                    if self.longest:
+                        continue
+                    # less preferred threads are cut
+                    return self._intern(tuple(pcs), True, False)
+                key = (pc, mask)
+                if key in seen:
+                    continue
+                seen.add(key)
+                if op == SPLIT:
+                    stack.append((ins[2], mask))
+                    stack.append((ins[1], mask))
+                elif op == JMP:
+                    stack.append((ins[1], mask))
+                elif op == ASSERT:
+                    if ctx[self._assert_index[pc]]:
+                        stack.append((pc + 1, mask))
+                elif op == LOOP:
+                    stack.append((pc + 1, mask | 1 << ins[1]))
+                elif op == UNTIL:
+                    bit = 1 << ins[1]
+                    if mask & bit:
+                        stack.append((ins[3], mask & ~bit))
+                    else:
+                        stack.append((ins[2], mask))
+                else:
+                    # SAVE
+                    stack.append((pc + 1, mask))
+        if self.longest:
+            pcs.sort()
+        return self._intern(tuple(pcs), matched, searching and not matched)
+
+
+class LinearMatch:
+    """A match found by the linear engine."""
+    __slots__ = ('string', 'regs')
+
+    def __init__(self, string, regs):
+        self.string = string
+        self.regs = regs
+
+    def start(self, group=0):
+        return self.regs[group][0]
+
+    def end(self, group=0):
+        return self.regs[group][1]
+
+    def span(self, group=0):
+        return self.regs[group]
+
+    def group(self, group=0):
+        start, end = self.regs[group]
+        if start == -1:
+            return None
+        return self.string[start:end]
+
+    def groups(self):
+        return tuple(self.group(g) for g in range(1, len(self.regs)))
+
+    def __repr__(self):
+        return '<LinearMatch span={} match={!r}>'.format(self.span(),
+                                                        self.group())
+
+
+class Matcher:
+    """Runs a Program over texts, see finditer()."""
+    def __init__(self, program):
+        self.program = program
+        self.code = program.forward.instructions
+        self.forward = _DFA(program.forward, longest=False)
+        self.reverse = _DFA(program.reverse, longest=True)
+
+    def finditer(self, text, pos=0):
+        """Yields the LinearMatch objects of the matches which
+        re.finditer(text, pos) would find.
+
+        Every search is linear in the length of the text after `pos`,
+        the whole iteration at most quadratic."""
+        size = len(text)
+        # like re, positions out of the text are moved to its ends
+        pos = min(max(pos, 0), size)
+        after_empty = False
+        while pos <= size:
+            if after_empty:
+                # the match at the position of an empty match
+                # must not be empty
+                regs = self._groups(text, pos, forbid_empty=True)
+                if regs is None:
+                    pos += 1
+                    after_empty = False
+                    continue
+            else:
+                end = self._find_end(text, pos)
+                if end is None:
+                    return
+                start = self._find_start(text, end, pos)
+                regs = self._groups(text, start)
+            yield LinearMatch(text, regs)
+            start, end = regs[0]
+            pos = end
+            after_empty = start == end
+
+    def _find_end(self, text, pos):
+        """Returns the end of the leftmost match at or after `pos`."""
+        dfa = self.forward
+        size = len(text)
+        state = dfa.start(text, pos, True)
+        end = None
+        while True:
+            if state.matched:
+                end = pos
+            if not state.pcs and not state.searching:
+                return end
+            if pos == size:
+                return end
+            ch = text[pos]
+            pos += 1
+            state = dfa.step(state, ch, text, pos)
+
+    def _find_start(self, text, end, lo):
+        """Returns the first position at or after `lo` from which
+        the pattern matches up to `end`."""
+        dfa = self.reverse
+        state = dfa.start(text, end, False)
+        pos = end
+        start = None
+        while True:
+            if state.matched:
+                start = pos
+            if not state.pcs or pos == lo:
+                return start
+            pos -= 1
+            state = dfa.step(state, text[pos], text, pos)
+
+    def _groups(self, text, start, forbid_empty=False):
+        """Runs the Pike VM from `start`, returns the regs of the
+        preferred match or None."""
+        code = self.code
+        size = len(text)
+        slots = (-1,) * (2 * (self.program.groups + 1))
+        threads = []
+        self._add(threads, set(), 0, slots, text, start)
+        matched = None
+        pos = start
+        while threads:
+            following = []
+            seen = set()
+            char = _code(text, pos) if pos < size else None
+            for pc, slots in threads:
+                ins = code[pc]
+                if ins[0] == MATCH:
+                    if forbid_empty and pos == start:
+                        continue
+                    # less preferred threads are cut
+                    matched = slots
+                    break
+                if char is not None and ins[1](char):
+                    self._add(following, seen, pc + 1, slots, text, pos + 1)
+            threads = following
+            pos += 1
+        if matched is None:
+            return None
+        return tuple(zip(matched[::2], matched[1::2]))
+
+    def _add(self, threads, seen, pc, slots, text, pos):
+        code = self.code
+        stack = [(pc, slots, 0)]
+        while stack:
+            pc, slots, mask = stack.pop()
+            ins = code[pc]
+            op = ins[0]
+            key = pc if op == CHAR or op == MATCH else (pc, mask)
+            if key in seen:
+                continue
+            seen.add(key)
+            if op == CHAR or op == MATCH:
+                threads.append((pc, slots))
+            elif op == SPLIT:
+                stack.append((ins[2], slots, mask))
+                stack.append((ins[1], slots, mask))
+            elif op == JMP:
+                stack.append((ins[1], slots, mask))
+            elif op == SAVE:
+                slot = ins[1]
+                slots = slots[:slot] + (pos,) + slots[slot + 1:]
+                stack.append((pc + 1, slots, mask))
+            elif op == ASSERT:
+                if ins[1](text, pos):
+                    stack.append((pc + 1, slots, mask))
+            elif op == LOOP:
+                stack.append((pc + 1, slots, mask | 1 << ins[1]))
+            elif op == UNTIL:
+                bit = 1 << ins[1]
+                if mask & bit:
+                    stack.append((ins[3], slots, mask & ~bit))
+                else:
+                    stack.append((ins[2], slots, mask))
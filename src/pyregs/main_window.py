@@ -17,18 +17,25 @@
 
 import types
 import re
+import time
+import queue
+import threading
 
 import tkinter as tk
 import tkinter.font as tkfont
 import tkinter.ttk as ttk
 
-from .widgets import (PRText, PRSpinbox, PRReadonlyText,
-                      PRStatusBar, PRTreeview, PRCheckbutton, Timer)
+from .widgets import (PRText, PRSpinbox, PRWindowedText, PRStatusBar,
+                      PRTreeview, PRVirtualTable, PRCheckbutton)
+from .scheduler import Scheduler, Debouncer
+from .textindex import LineIndex
+from .incremental import (IncrementalRegExAnalyzer,
+                          ProcessIncrementalRegExAnalyzer)
+from .profiler import ProfilingRegExAnalyzer
 from .util import bind, log_except
-from .quickref_window import QuickReferenceWindow
-from .about_window import AboutWindow
-from .tooltip import ToolTip
 from . import analyzer
+from . import engines
+from . import redos
 
 import logging
 log = logging.getLogger(__name__)
@@ -38,22 +45,95 @@ IGNORECASE_TOOLTIP = """Perform case-insensitive matching; expressions like [A-Z
 LOCALE_TOOLTIP = """Make \w, \W, \b, \B, \s and \S dependent on the current locale. The use of this flag is discouraged as the locale mechanism is very unreliable, and it only handles one “culture” at a time anyway; you should use Unicode matching instead, which is the default in Python 3 for Unicode (str) patterns."""
 _DOTALL_TOOLTIP = """Make the '.' special character match any character at all,including a newline; without this flag, '.' will match anything except a newline."""
 MULTILINTE_TOOLTIP = """When specified, the pattern character '^' matches at the beginning of the string and at the beginning of each line (immediately following each newline); and the pattern character '$' matches at the end of the string and at the end of each line (immediately preceding each newline). By default, '^' matches only at the beginning of the string, and '$' only at the end of the string and immediately before the newline (if any) at the end of the string."""
+ENGINE_AUTO = 'auto'
+ENGINE_CHOICES = (
+    (ENGINE_AUTO, 'Auto', "Use the backtracking engine, and the linear one if the analysis times out."),
+    (engines.BACKTRACKING, 'Backtracking', "Use the re module. Some patterns take exponential time on some texts."),
+    (engines.LINEAR, 'Linear', "Use an engine which never backtracks: finding a match takes time linear in the length of the text, finding all of them at most quadratic. It is slower in general and does not support backreferences, lookarounds, IGNORECASE and LOCALE."),
+)
+PROFILE_TOOLTIP = """Find the matches with an instrumented backtracking matcher which counts the steps and backtracks of every sub-expression, shown in the Profile tab. It is much slower than the re module and stops after a fixed number of steps."""
+PROFILE_HINT = 'Check Profile in the Options tab to count the steps of the sub-expressions.'
 VERBOSE_TOOLTIP = """Whitespace within the pattern is ignored, except when in a character class or preceded by an unescaped backslash, and, when a line contains a '#' neither in a character class or preceded by an unescaped backslash, all characters from the leftmost such '#' through the end of the line are ignored."""
 
 
 class MainWindow:
-    ANALYZER_CHECK_PERIOD = 100
+    ANALYZER_EVENT = '<<AnalyzerEvent>>'
+    ANALYZER_TIMEOUT = 10
+    ANALYZER_CPU_TIMEOUT = 10
+    MATCHES_PAGE_SIZE = 100000
+    # the input is analyzed after a pause in typing of at least
+    # INPUT_DELAY ms, or INPUT_COST_FACTOR times the duration
+    # of the previous analysis, but at most INPUT_MAX_DELAY ms
+    INPUT_DELAY = 50
+    INPUT_MAX_DELAY = 2000
+    INPUT_COST_FACTOR = 2
+    FILE_MATCH_CONTEXT = 512
+    # characters of the analyzed text loaded into the Match tab
+    MATCH_WINDOW_SIZE = 65536
+    # all matches are highlighted in the visible part of the Match tab
+    # and HIGHLIGHT_MARGIN characters around it, HIGHLIGHT_LIMIT at most
+    HIGHLIGHT_MARGIN = 4096
+    HIGHLIGHT_LIMIT = 10000
+    HIGHLIGHT_DELAY = 20
+    GROUP_COLORS = ('#ffc8c8', '#c8f0c8', '#d8c8ff', '#ffe0a8', '#c0ecec')
+    # group values shown in the Matches tab are cut at this length
+    TABLE_VALUE_LIMIT = 200
+    # a profiling analysis stops after this many steps
+    PROFILE_MAX_STEPS = 2000000
+    # of the backtracking risk, by severity
+    RISK_COLORS = ('dark green', 'dark orange', 'red')
 
     def __init__(self, root):
         # self._previous_state = None
         # self._current_state = None
         self.root = root
+        self.analyzed_file = None
+        self.scheduler = Scheduler(root)
         self.setup_analyzer()
         self.setup_font()
         self.setup_ui()
 
     def setup_analyzer(self):
         self.analyzer = analyzer.RegExAnalyzer()
+        self.analyzer_worker = analyzer.AnalysisWorker()
+        self.analyzer_worker.start()
+        # analyzers notify the main loop through this queue
+        # and a virtual event instead of being polled
+        self._analyzer_events = queue.Queue()
+        # set while an event is on its way to the main loop, the handler
+        # clears it before draining the queue so no put() goes unnoticed
+        self._wake_lock = threading.Lock()
+        self._wake_pending = False
+        self._finished_analyzer = None
+        self._shown_analyzer = None
+        self._shown_count = 0
+        self._highlighted = None
+        self._analysis_started = None
+        self.root.bind(self.ANALYZER_EVENT, self.on_analyzer_event)
+
+    def _on_analyzer_changed(self, anl):
+        """Called from the analyzer thread."""
+        self._analyzer_events.put(anl)
+        with self._wake_lock:
+            wake_up = not self._wake_pending
+            self._wake_pending = True
+        if wake_up:
+            self.root.event_generate(self.ANALYZER_EVENT, when='tail')
+
+    @log_except
+    def on_analyzer_event(self, event=None):
+        with self._wake_lock:
+            self._wake_pending = False
+        changed = False
+        while True:
+            try:
+                anl = self._analyzer_events.get_nowait()
+            except queue.Empty:
+                break
+            changed = changed or anl is self.analyzer
+        # notifications of superseded analyzers are dropped
+        if changed:
+            self.scheduler.schedule('check_analyzer', 0, self.check_analyzer)
 
     def setup_font(self):
         self.font = tkfont.Font(family='Helvetica', size=10)
@@ -70,7 +150,11 @@ class MainWindow:
 
         ttk_style = ttk.Style()
         ttk_style.configure('.', font=self.font)
-        self._input_timer = Timer(root, 300, self.on_input_modified)
+        self._input_debouncer = Debouncer(self.scheduler,
+                                          self.INPUT_DELAY,
+                                          self.on_input_modified,
+                                          max_delay=self.INPUT_MAX_DELAY,
+                                          cost_factor=self.INPUT_COST_FACTOR)
 
         #-- setup menu ---#
         #-----------------#
@@ -78,6 +162,11 @@ class MainWindow:
         root.config(menu=menu)
         pr_menu = tk.Menu(menu, tearoff=False, font=self.font)
         menu.add_cascade(label='PyRegs', menu=pr_menu)
+        pr_menu.add_command(label='Analyze file…',
+                            command=self.on_analyze_file_menu)
+        pr_menu.add_command(label='Analyze text',
+                            command=self.on_analyze_text_menu)
+        pr_menu.add_separator()
         pr_menu.add_command(label='Exit', command=root.quit)
 
         tools_menu = tk.Menu(menu, tearoff=False, font=self.font)
@@ -111,7 +200,12 @@ class MainWindow:
             font=self.font,
         )
         self.pattern_tbox.pack(fill=tk.BOTH)
-        bind(self.pattern_tbox.on_modified, self._input_timer.restart)
+        bind(self.pattern_tbox.on_modified, self._input_debouncer.restart)
+
+        # the backtracking risk of the pattern
+        self.risk_label = ttk.Label(frame, anchor=tk.W)
+        self.risk_label.pack(fill=tk.X)
+        self._shown_risks = None
 
         #--- setup the analyzed text frame ---#
         #-------------------------------------#
@@ -132,7 +226,7 @@ class MainWindow:
             font=self.font,
         )
         self.analyzed_tbox.pack(fill=tk.BOTH)
-        bind(self.analyzed_tbox.on_modified, self._input_timer.restart)
+        bind(self.analyzed_tbox.on_modified, self._input_debouncer.restart)
 
         #--- setup results frame and notebook ---#
         #----------------------------------------#
@@ -174,13 +268,19 @@ class MainWindow:
         nb.grid(row=1, columnspan=3, sticky=(tk.N + tk.S + tk.E + tk.W))
         frame = ttk.Frame(nb)
         frame.pack(fill=tk.BOTH, expand=True)
-        match_tbox = PRReadonlyText(
+        match_tbox = PRWindowedText(
             frame,
             height=TEXT_HEIGHT_LINES,
             width=TEXT_WIDTH_CHARS,
             font=self.font,
+            window_size=self.MATCH_WINDOW_SIZE,
         )
+        # tags created later take priority
+        match_tbox.tag_config('match', background='#d8e8ff')
         match_tbox.tag_config('highlight', background='yellow')
+        for i, color in enumerate(self.GROUP_COLORS):
+            match_tbox.tag_config('group{}'.format(i), background=color)
+        bind(match_tbox.on_view_changed, self.on_match_view_changed)
         match_tbox.pack(fill=tk.BOTH, expand=True)
         self.match_tbox = match_tbox
         nb.add(frame, text='Match', underline=0, padding=2)
@@ -202,6 +302,34 @@ class MainWindow:
         self.match_tree = tree
         nb.add(frame, text='Group', underline=0)
 
+        # NEXT FRAME
+        #----------
+        table = PRVirtualTable(nb, rows=TEXT_HEIGHT_LINES)
+        bind(table.get_row, self.get_matches_table_row)
+        bind(table.sort_key, self.get_matches_table_sort_key)
+        bind(table.on_row_selected, self.on_matches_table_row_selected)
+        self.matches_table = table
+        nb.add(table, text='Matches', underline=2)
+
+        # NEXT FRAME
+        #----------
+        frame = ttk.Frame(nb)
+        table = PRVirtualTable(frame, rows=TEXT_HEIGHT_LINES - 1)
+        table.set_columns([('expr', 'Sub-expression'),
+                           ('steps', 'Steps'),
+                           ('backtracks', 'Backtracks'),
+                           ('share', 'Share')])
+        bind(table.get_row, self.get_profile_table_row)
+        bind(table.sort_key, self.get_profile_table_sort_key)
+        table.pack(fill=tk.BOTH, expand=True)
+        self.profile_table = table
+        self._profile_rows = []
+        lbl = ttk.Label(frame, justify=tk.LEFT, anchor=tk.W,
+                        text=PROFILE_HINT)
+        lbl.pack(fill=tk.X)
+        self.profile_label = lbl
+        nb.add(frame, text='Profile', underline=0)
+
         # NEXT FRAME
         #----------
         frame = ttk.Frame(nb)
@@ -211,47 +339,86 @@ class MainWindow:
         # frame.rowconfigure(1, weight=1)
         # frame.columnconfigure((0,1), weight=1, uniform=0)
         def _make_tooltip(parent, text):
-            ToolTip(parent,
-                    wraplength=300,
-                    font=self.font,
-                    text=text)
+            # the tooltip is created when the pointer enters
+            # the widget for the first time
+            def on_enter(event):
+                from .tooltip import ToolTip
+                parent.unbind('<Enter>', funcid)
+                tooltip = ToolTip(parent,
+                                  wraplength=300,
+                                  font=self.font,
+                                  text=text)
+                tooltip.enter(event)
+            funcid = parent.bind('<Enter>', on_enter, '+')
 
         cb = PRCheckbutton(fframe, text='ASCII', font=self.font)
         cb.grid(row=0, column=0, sticky=tk.W)
-        bind(cb.on_modified, self._input_timer.restart)
+        bind(cb.on_modified, self._input_debouncer.restart)
         _make_tooltip(cb, ASCII_TOOLTIP)
         self.ascii_cb = cb
 
         cb = PRCheckbutton(fframe, text='IGNORECASE', font=self.font)
         cb.grid(row=1, column=0, sticky=tk.W)
-        bind(cb.on_modified, self._input_timer.restart)
+        bind(cb.on_modified, self._input_debouncer.restart)
         _make_tooltip(cb, IGNORECASE_TOOLTIP)
         self.ignorecase_cb = cb
 
         cb = PRCheckbutton(fframe, text='LOCALE', font=self.font)
         cb.grid(row=2, column=0, sticky=tk.W)
-        bind(cb.on_modified, self._input_timer.restart)
+        bind(cb.on_modified, self._input_debouncer.restart)
         _make_tooltip(cb, LOCALE_TOOLTIP)
         self.locale_cb = cb
 
         cb = PRCheckbutton(fframe, text='MULTILINE', font=self.font)
         cb.grid(row=2, column=0, sticky=tk.W)
-        bind(cb.on_modified, self._input_timer.restart)
+        bind(cb.on_modified, self._input_debouncer.restart)
         _make_tooltip(cb, MULTILINTE_TOOLTIP)
         self.multiline_cb = cb
 
         cb = PRCheckbutton(fframe, text='DOTALL', font=self.font)
         cb.grid(row=3, column=0, sticky=tk.W)
-        bind(cb.on_modified, self._input_timer.restart)
+        bind(cb.on_modified, self._input_debouncer.restart)
         _make_tooltip(cb, _DOTALL_TOOLTIP)
         self.dotall_cb = cb
 
         cb = PRCheckbutton(fframe, text='VERBOSE', font=self.font)
         cb.grid(row=4, column=0, sticky=tk.W)
-        bind(cb.on_modified, self._input_timer.restart)
+        bind(cb.on_modified, self._input_debouncer.restart)
         _make_tooltip(cb, VERBOSE_TOOLTIP)
         self.verbose_cb = cb
 
+        # dframe = display_frame
+        dframe = tk.LabelFrame(frame, text='Display', font=self.font)
+        dframe.grid(row=0, column=1, sticky=tk.N)
+
+        cb = PRCheckbutton(dframe, text='Highlight all matches',
+                           font=self.font)
+        cb.grid(row=0, column=0, sticky=tk.W)
+        bind(cb.on_modified, self.on_match_view_changed)
+        self.highlight_all_cb = cb
+
+        cb = PRCheckbutton(dframe, text='Highlight groups', font=self.font)
+        cb.grid(row=1, column=0, sticky=tk.W)
+        bind(cb.on_modified, self.on_match_view_changed)
+        self.highlight_groups_cb = cb
+
+        # eframe = engine_frame
+        eframe = tk.LabelFrame(frame, text='Engine', font=self.font)
+        eframe.grid(row=0, column=2, sticky=tk.N)
+        self.engine_var = tk.StringVar(value=ENGINE_AUTO)
+        for row, (value, text, tooltip) in enumerate(ENGINE_CHOICES):
+            rb = tk.Radiobutton(eframe, text=text, value=value,
+                                variable=self.engine_var, font=self.font,
+                                command=self._input_debouncer.restart)
+            rb.grid(row=row, column=0, sticky=tk.W)
+            _make_tooltip(rb, tooltip)
+
+        cb = PRCheckbutton(eframe, text='Profile', font=self.font)
+        cb.grid(row=len(ENGINE_CHOICES), column=0, sticky=tk.W)
+        bind(cb.on_modified, self._input_debouncer.restart)
+        _make_tooltip(cb, PROFILE_TOOLTIP)
+        self.profile_cb = cb
+
         nb.add(frame, text='Options', underline=0)
 
         # STATUS BAR #
@@ -261,11 +428,16 @@ class MainWindow:
 
     def on_input_modified(self):
         pattern_text = self.pattern_tbox.text
-        analyzed_text = self.analyzed_tbox.text
         pattern_text = pattern_text.strip()
-        analyzed_text = analyzed_text.strip()
-
-        if pattern_text == '' or analyzed_text == '':
+        if self.analyzed_file is not None:
+            # byte patterns run directly over the memory-mapped file
+            analyzed_text = self.analyzed_file
+            pattern_text = pattern_text.encode('utf-8')
+        else:
+            analyzed_text = self.analyzed_tbox.text
+            analyzed_text = analyzed_text.strip()
+
+        if len(pattern_text) == 0 or len(analyzed_text) == 0:
             self._clear_results()
             return
 
@@ -283,22 +455,80 @@ class MainWindow:
         self.match_spinbox.config(state=tk.DISABLED)
         self.match_tbox.clear()
         self.match_tree.clear()
+        self.matches_table.set_count(0)
+        self._clear_profile()
+        self._show_risks(None)
 
     @log_except
     def _analyze(self, pattern_text, analyzed_text, flags=0):
         # configure widgets
         self.match_spinbox.config(state='disabled', from_=0, to=0)
         self.match_tbox.clear()
-        self._previous_match_ind_start = None
-        self._previous_match_ind_end = None
+        self.matches_table.set_count(0)
+        self._clear_profile()
         self._previous_match_number = 1
 
-        # restart analyzer
-        self.analyzer.stop()
-        self.analyzer = analyzer.RegExAnalyzer(pattern_text,
-                                                analyzed_text,
-                                                flags)
-        self.analyzer.start()
+        if self.profile_cb.checked:
+            # the steps are counted in the worker thread, their number
+            # is bounded, so no process is needed
+            self.analyzer_worker.cancel()
+            self.analyzer = ProfilingRegExAnalyzer(
+                pattern_text,
+                analyzed_text,
+                flags,
+                max_steps=self.PROFILE_MAX_STEPS)
+            self._start_analyzer()
+            return
+
+        # repeated states are rendered from the result cache
+        cached = analyzer.RegExAnalyzer.from_cache(pattern_text,
+                                                   analyzed_text,
+                                                   flags)
+        if cached is not None:
+            self.analyzer_worker.cancel()
+            self.analyzer = cached
+            # no analysis has run, there is no cost to report
+            self._analysis_started = None
+            self.check_analyzer()
+            return
+
+        engine = self.engine_var.get()
+        fallback = None
+        if engine == ENGINE_AUTO:
+            engine, fallback = engines.BACKTRACKING, engines.LINEAR
+
+        # supersede the previous analyzer
+        previous = self.analyzer
+        analyzer_class = analyzer.ProcessRegExAnalyzer
+        options = {}
+        if (previous.engine in (engine, fallback)
+                and IncrementalRegExAnalyzer.can_resume(previous,
+                                                        pattern_text,
+                                                        analyzed_text,
+                                                        flags)):
+            # an edit of the text only re-scans around the edited range
+            # with the engine which found the previous matches; the scan
+            # still runs in a worker process within the usual budgets
+            analyzer_class = ProcessIncrementalRegExAnalyzer
+            options['previous'] = previous
+            if previous.engine != engine:
+                engine, fallback = previous.engine, None
+        self.analyzer = analyzer_class(
+            pattern_text,
+            analyzed_text,
+            flags,
+            page_size=self.MATCHES_PAGE_SIZE,
+            timeout=self.ANALYZER_TIMEOUT,
+            cpu_timeout=self.ANALYZER_CPU_TIMEOUT,
+            engine=engine,
+            fallback_engine=fallback,
+            **options)
+        self._start_analyzer()
+
+    def _start_analyzer(self):
+        self.analyzer.listener = self._on_analyzer_changed
+        self._analysis_started = time.monotonic()
+        self.analyzer_worker.submit(self.analyzer)
         self.check_analyzer()
 
     @log_except
@@ -310,26 +540,128 @@ class MainWindow:
         state = anl.state
         status = anl.status
         self.status_bar.text = status
+        self._show_risks(anl.risks)
+
+        if state not in [analyzer.FINISHED_SUCCESS,
+                         analyzer.FINISHED_ERROR,
+                         analyzer.FINISHED_TIMEOUT]:
+            self.status_bar.color = 'black'
+            # matches found so far are browsable during the analysis
+            self._show_matches(anl, anl.matches_available)
+            return
 
-        if state not in [analyzer.FINISHED_SUCCESS, analyzer.FINISHED_ERROR]:
-            self.root.after(self.ANALYZER_CHECK_PERIOD, self.check_analyzer)
+        # results of an analyzer are shown once
+        if anl is self._finished_analyzer:
             return
+        self._finished_analyzer = anl
+        if self._analysis_started is not None:
+            self._input_debouncer.report_cost(time.monotonic()
+                                              - self._analysis_started)
+            self._analysis_started = None
 
         if state == analyzer.FINISHED_SUCCESS:
-            # enable and setup the widgets
-            if len(anl.matches) == 0:
-                return
-
-            self.match_tbox.text = anl.text
-            self.match_spinbox.config(state='normal',
-                                      from_=1,
-                                      to=len(anl.matches))
+            self._show_matches(anl, len(anl.matches))
+        elif state == analyzer.FINISHED_ERROR:
+            pass
+        elif state == analyzer.FINISHED_TIMEOUT:
+            # the pattern is likely to backtrack catastrophically
+            self.status_bar.color = 'red'
+
+        if (isinstance(anl, ProfilingRegExAnalyzer)
+                and state != analyzer.FINISHED_ERROR):
+            # the profile of a stopped analysis shows where the steps go
+            self._show_matches(anl, len(anl.matches))
+            self._show_profile(anl)
+
+    def _show_profile(self, anl):
+        profile = anl.profile
+        steps, backtracks = profile.inclusive()
+        total = max(profile.total_steps, 1)
+        # the hottest sub-expressions first, the outer ones before
+        # the inner ones with the same count
+        nodes = sorted(profile.nodes,
+                       key=lambda node: (-steps[node.index], node.depth))
+        self._profile_rows = [(node, steps[node.index],
+                               backtracks[node.index],
+                               steps[node.index] / total)
+                              for node in nodes]
+        self.profile_table.set_count(len(self._profile_rows))
+
+        attempts = profile.hottest_attempts()
+        if isinstance(anl.text, str):
+            lines = LineIndex(anl.text)
+            position = lambda offset: '{}.{}'.format(*lines.position(offset))
+        else:
+            position = str
+        text = '{} steps, {} backtracks. Costliest match attempts: {}'.format(
+            profile.total_steps, profile.total_backtracks,
+            ', '.join('{} ({} steps)'.format(position(start), count)
+                      for count, start in attempts))
+        self.profile_label.config(text=text)
+
+    def _clear_profile(self):
+        self._profile_rows = []
+        self.profile_table.set_count(0)
+        self.profile_label.config(text=PROFILE_HINT)
+
+    def get_profile_table_row(self, index):
+        node, steps, backtracks, share = self._profile_rows[index]
+        text = '  ' * node.depth + node.text
+        if len(text) > self.TABLE_VALUE_LIMIT:
+            text = text[:self.TABLE_VALUE_LIMIT] + '…'
+        return [text, steps, backtracks, '{:.1%}'.format(share)]
+
+    def get_profile_table_sort_key(self, column):
+        rows = self._profile_rows
+        if column == 'expr':
+            # the order of the nodes in the pattern
+            return lambda index: rows[index][0].index
+        if column == 'backtracks':
+            return lambda index: rows[index][2]
+        return lambda index: rows[index][1]
+
+    def _show_risks(self, risks):
+        if risks is self._shown_risks:
+            return
+        self._shown_risks = risks
+        if risks is None:
+            self.risk_label.config(text='')
+            return
+        severity = redos.severity(risks)
+        text = 'Backtracking risk: {}'.format(redos.SEVERITY_NAMES[severity])
+        if risks:
+            text += ', {}: {}'.format(risks[0].text, risks[0].reason)
+        if len(risks) > 1:
+            text += ' (and {} more)'.format(len(risks) - 1)
+        self.risk_label.config(text=text,
+                               foreground=self.RISK_COLORS[severity])
+
+    def _show_matches(self, anl, count):
+        """Enables browsing of the first `count` matches of `anl`."""
+        if anl is not self._shown_analyzer:
+            self._shown_analyzer = anl
+            self._shown_count = 0
+        if count <= self._shown_count:
+            return
 
-            if (self._previous_match_number <= len(anl.matches)):
+        if self._shown_count == 0:
+            # enable and setup the widgets
+            if isinstance(anl.text, str):
+                self.match_tbox.load(anl.text)
+            self.match_spinbox.config(state='normal', from_=1, to=count)
+            columns = [('match', '#'), ('span', 'Span')]
+            columns.extend(('group{}'.format(i), str(name))
+                           for i, name in enumerate(_group_names(anl.matches), 1))
+            self.matches_table.set_columns(columns)
+            if self._previous_match_number <= count:
                 self.match_spinbox.clear()
                 self.match_spinbox.text = self._previous_match_number
-        elif state == analyzer.FINISHED_ERROR:
-            pass
+        else:
+            # only extend the range, the shown match stays
+            self.match_spinbox.config(to=count)
+        self._shown_count = count
+        self.matches_table.set_count(count)
+        self.on_match_view_changed()
 
     @log_except
     def on_match_spinbox_modified(self, value):
@@ -338,47 +670,200 @@ class MainWindow:
         except ValueError:
             return
         mo = self.analyzer.matches[match_id]
-        self.update_match_box(mo)
+        if isinstance(self.analyzer.text, str):
+            self.update_match_box(mo)
+        else:
+            self.update_file_match_box(mo)
         self.update_tree_view(mo)
 
     def update_match_box(self, mo):
-        index_start = '1.0+{} chars'.format(mo.start())
-        index_end = '1.0+{} chars'.format(mo.end())
-        # remove previous tag if any
-        if self._previous_match_ind_start is not None:
-            self.match_tbox.tag_remove('highlight',
-                                       self._previous_match_ind_start,
-                                       self._previous_match_ind_end)
+        start, end = mo.span()
+        # only the region around the match is loaded into the text box
+        self.match_tbox.show(start, end)
+        self.match_tbox.tag_clear('highlight')
+        self.match_tbox.tag_span('highlight', start, end)
+        self.match_tbox.mark_set(tk.INSERT, self.match_tbox.index_of(start))
+
+    def get_matches_table_row(self, index):
+        mo = self.analyzer.matches[index]
+        row = [index + 1, '{}-{}'.format(*mo.span())]
+        for value in mo.groups():
+            if value is None:
+                value = ''
+            elif isinstance(value, bytes):
+                value = _decode(value)
+            if len(value) > self.TABLE_VALUE_LIMIT:
+                value = value[:self.TABLE_VALUE_LIMIT] + '…'
+            row.append(value)
+        return row
+
+    def get_matches_table_sort_key(self, column):
+        if not column.startswith('group'):
+            # matches are found in the order of their spans
+            return None
+        group = int(column[len('group'):])
+        matches = self.analyzer.matches
+
+        def key(index):
+            value = matches[index].group(group)
+            return (value is not None, value)
+        return key
+
+    def on_matches_table_row_selected(self, index):
+        self.match_spinbox.text = index + 1
+
+    def on_match_view_changed(self, *args):
+        self.scheduler.schedule('highlight_matches', self.HIGHLIGHT_DELAY,
+                                self.highlight_matches)
 
+    @log_except
+    def highlight_matches(self):
+        """Highlights the matches (and their groups) in the visible part
+        of the Match tab, the rest of the matches is never tagged."""
+        tbox = self.match_tbox
+        anl = self.analyzer
+        show_all = self.highlight_all_cb.checked
+        show_groups = self.highlight_groups_cb.checked
+        if (anl is not self._shown_analyzer
+                or tbox.source is not anl.text):
+            show_all = show_groups = False
+
+        first, last = tbox.visible_range()
+        first = max(tbox.base, first - self.HIGHLIGHT_MARGIN)
+        last = min(tbox.window_end, last + self.HIGHLIGHT_MARGIN)
+        state = (anl, self._shown_count, first, last, show_all, show_groups)
+        if state == self._highlighted:
+            # yscrollcommand is called on every redisplay
+            return
+        self._highlighted = state
+
+        tbox.tag_clear('match')
+        for i in range(len(self.GROUP_COLORS)):
+            tbox.tag_clear('group{}'.format(i))
+        if not (show_all or show_groups):
+            return
+
+        matches = anl.matches
+        count = min(self._shown_count, len(matches))
+        index = matches.bisect_end(first)
+        for index in range(index, min(count, index + self.HIGHLIGHT_LIMIT)):
+            mo = matches[index]
+            if mo.start() > last:
+                break
+            if show_all:
+                tbox.tag_span('match', mo.start(), mo.end())
+            if show_groups:
+                for group in range(1, matches.groups_count + 1):
+                    start, end = mo.span(group)
+                    if start != -1:
+                        tag = 'group{}'.format((group - 1)
+                                               % len(self.GROUP_COLORS))
+                        tbox.tag_span(tag, start, end)
+
+    def update_file_match_box(self, mo):
+        """Show the match together with a few bytes of context around it,
+        the analyzed file itself is never loaded into the text box."""
+        data = self.analyzer.text
+        start, end = mo.span()
+        context_start = max(0, start - self.FILE_MATCH_CONTEXT)
+        context_end = min(len(data), end + self.FILE_MATCH_CONTEXT)
+
+        header = 'Offset {}-{}:\n'.format(start, end)
+        before = _decode(data[context_start:start])
+        match = _decode(data[start:end])
+        after = _decode(data[end:context_end])
+        text = header + before + match + after
+        self.match_tbox.text = text
+
+        lines = LineIndex(text)
+        start = len(header) + len(before)
+        index_start = '{}.{}'.format(*lines.position(start))
+        index_end = '{}.{}'.format(*lines.position(start + len(match)))
         self.match_tbox.tag_add('highlight', index_start, index_end)
-        self.match_tbox.mark_set(tk.INSERT, index_start)
         self.match_tbox.see(index_start)
-        self._previous_match_ind_start = index_start
-        self._previous_match_ind_end = index_end
 
     def update_tree_view(self, mo):
         self.match_tree.clear()
 
-        anl = self.analyzer
-        if anl.re_groups_count == 0:
+        # group information of the store is known while the analysis
+        # is still running
+        matches = self.analyzer.matches
+        if matches.groups_count == 0:
             return
 
         i = 1
         groups = []
         for val in mo.groups():
+            if isinstance(val, bytes):
+                val = _decode(val)
             groups.append((i, val))
             i += 1
 
         # map named groups instead of group numbers
-        for group_name, group_number in anl.re_groupindex.items():
+        for group_name, group_number in matches.groupindex.items():
             new_tuple = (group_name, groups[group_number - 1][1])
             groups[group_number - 1] = new_tuple
 
         for item in groups:
             self.match_tree.insert('', tk.END, values=item)
 
+    def on_analyze_file_menu(self):
+        import tkinter.filedialog as filedialog
+        path = filedialog.askopenfilename(parent=self.root,
+                                          title='Analyze file')
+        if not path:
+            return
+        try:
+            mapped = analyzer.map_file(path)
+        except (OSError, ValueError) as e:
+            self.status_bar.text = 'Unable to open {}: {}'.format(path, e)
+            return
+        self._close_analyzed_file()
+        self.analyzed_file = mapped
+
+        self.analyzed_tbox.config(state=tk.NORMAL)
+        self.analyzed_tbox.text = 'Analyzing file {} ({} bytes)'.format(
+            path, len(self.analyzed_file))
+        self.analyzed_tbox.config(state=tk.DISABLED)
+
+    def on_analyze_text_menu(self):
+        if self.analyzed_file is None:
+            return
+        self._close_analyzed_file()
+        self.analyzed_tbox.config(state=tk.NORMAL)
+        self.analyzed_tbox.clear()
+
+    def _close_analyzed_file(self):
+        """Unmaps the analyzed file right away instead of leaving its
+        descriptor open (and the file locked on Windows) until the map
+        is collected."""
+        mapped = self.analyzed_file
+        if mapped is None:
+            return
+        self.analyzed_file = None
+        # nothing may read the map once it is closed
+        self.analyzer_worker.cancel()
+        self.analyzer = analyzer.RegExAnalyzer()
+        self._clear_results()
+        if isinstance(mapped, analyzer.MappedFile):
+            mapped.close()
+
     def on_tools_library_menu(self):
+        from .quickref_window import QuickReferenceWindow
         QuickReferenceWindow(self.root)
 
     def on_help_about_menu(self):
+        from .about_window import AboutWindow
         AboutWindow(self.root)
+
+
+def _group_names(matches):
+    """Names of the groups of the pattern, numbers of unnamed groups."""
+    names = list(range(1, matches.groups_count + 1))
+    for name, number in matches.groupindex.items():
+        names[number - 1] = name
+    return names
+
+
+def _decode(data):
+    return data.decode('utf-8', errors='replace')
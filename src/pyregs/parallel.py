@@ -0,0 +1,254 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Parallel analysis of line-oriented patterns.
+
+A pattern which can never match a newline finds the same matches in
+the whole text as in every line separately. Such texts are split on line
+boundaries into segments, which are scanned in a pool of processes.
+
+The entry points are pyregs.analyze(..., parallel=True) and the
+`--parallel` option of the batch mode. Neither may be used in a daemonic
+process, which can not start the pool.
+"""
+
+import os
+import re
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_constants
+
+from .analyzer import RegExAnalyzer, MappedFile, pattern_cache
+from . import engines
+
+# categories of character classes which include '\n'
+_NEWLINE_CATEGORIES = frozenset([
+    sre_constants.CATEGORY_SPACE,
+    sre_constants.CATEGORY_NOT_DIGIT,
+    sre_constants.CATEGORY_NOT_WORD,
+    sre_constants.CATEGORY_LINEBREAK,
+])
+_NEWLINE = ord('\n')
+
+
+def can_split_lines(compiled):
+    """Returns True if the compiled pattern (a CompiledPattern) finds
+    the same matches in a text split on line boundaries as in the whole
+    text, i.e. none of its parts can match a newline and it has no
+    anchors bound to the beginning or end of the whole string.
+    """
+    try:
+        return _subpattern_is_line_local(compiled.tree,
+                                         compiled.regex.flags)
+    except _Unsafe:
+        return False
+
+
+class _Unsafe(Exception):
+    pass
+
+
+def _subpattern_is_line_local(subpattern, flags):
+    for op, av in subpattern:
+        _check_node(op, av, flags)
+    return True
+
+
+def _check_node(op, av, flags):
+    c = sre_constants
+    if op is c.LITERAL:
+        if av == _NEWLINE:
+            raise _Unsafe()
+    elif op is c.NOT_LITERAL:
+        if av != _NEWLINE:
+            raise _Unsafe()
+    elif op is c.ANY:
+        if flags & re.DOTALL:
+            raise _Unsafe()
+    elif op is c.IN:
+        if _set_has_newline(av):
+            raise _Unsafe()
+    elif op is c.AT:
+        if av in (c.AT_BEGINNING, c.AT_END):
+            if not flags & re.MULTILINE:
+                raise _Unsafe()
+        elif av not in (c.AT_BOUNDARY, c.AT_NON_BOUNDARY):
+            raise _Unsafe()
+    elif op is c.BRANCH:
+        for p in av[1]:
+            _subpattern_is_line_local(p, flags)
+    elif op is c.SUBPATTERN:
+        group, add_flags, del_flags, p = av
+        _subpattern_is_line_local(p, (flags | add_flags) & ~del_flags)
+    elif op in _REPEATS:
+        _subpattern_is_line_local(av[2], flags)
+    elif op in (c.ASSERT, c.ASSERT_NOT):
+        _subpattern_is_line_local(av[1], flags)
+    elif op is c.GROUPREF_EXISTS:
+        group, yes, no = av
+        _subpattern_is_line_local(yes, flags)
+        if no is not None:
+            _subpattern_is_line_local(no, flags)
+    elif op is getattr(c, 'ATOMIC_GROUP', None):
+        _subpattern_is_line_local(av, flags)
+    elif op is not c.GROUPREF:
+        raise _Unsafe()
+
+
+_REPEATS = tuple(getattr(sre_constants, name)
+                 for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+                 if hasattr(sre_constants, name))
+
+
+def _set_has_newline(items):
+    c = sre_constants
+    negate = False
+    found = False
+    for op, av in items:
+        if op is c.NEGATE:
+            negate = True
+        elif op is c.LITERAL:
+            found = found or av == _NEWLINE
+        elif op is c.RANGE:
+            found = found or av[0] <= _NEWLINE <= av[1]
+        elif op is c.CATEGORY:
+            found = found or av in _NEWLINE_CATEGORIES
+        else:
+            # be conservative about anything unknown
+            return True
+    return found != negate
+
+
+def split_lines(text, parts):
+    """Returns a list of (start, end) segments of the text,
+    split right after a newline into about `parts` parts."""
+    newline = '\n' if isinstance(text, str) else b'\n'
+    size = len(text)
+    bounds = [0]
+    for i in range(1, parts):
+        target = max(size * i // parts, bounds[-1])
+        pos = text.find(newline, target)
+        if pos == -1:
+            break
+        if pos + 1 > bounds[-1]:
+            bounds.append(pos + 1)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:])
+            if start < end or start == 0]
+
+
+def _scan_segment(pattern, flags, text, pos, endpos, offset, last):
+    """Scans text[pos:endpos] in a pool process. Returns the spans
+    of the matches and their groups with `offset` added."""
+    regex = pattern_cache.get(pattern, flags).regex
+    spans = array('q')
+    for mo in regex.finditer(text, pos, endpos):
+        # an (empty) match at the end of a segment is found
+        # at the beginning of the next one
+        if not last and mo.start() == endpos:
+            break
+        for start, end in mo.regs:
+            if start == -1:
+                spans.extend((-1, -1))
+            else:
+                spans.extend((start + offset, end + offset))
+    return spans
+
+
+class SegmentMatch:
+    """A match returned by a pool process."""
+    __slots__ = ('regs',)
+
+    def __init__(self, regs):
+        self.regs = regs
+
+    def start(self, group=0):
+        return self.regs[group][0]
+
+    def end(self, group=0):
+        return self.regs[group][1]
+
+    def span(self, group=0):
+        return self.regs[group]
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def default_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor()
+        return _executor
+
+
+class ParallelRegExAnalyzer(RegExAnalyzer):
+    """RegExAnalyzer which scans line-oriented patterns on multiple cores.
+
+    Texts of at least `min_size` characters are split on line boundaries
+    and the segments are scanned in a process pool, provided that the
+    pattern can not match across lines (see can_split_lines()).
+    Otherwise, or with an engine other than the backtracking one,
+    the analyzer falls back to the serial scan.
+    """
+    def __init__(self, pattern='', text='', flags=0, workers=None,
+                 min_size=1024 * 1024, executor=None, **kwargs):
+        RegExAnalyzer.__init__(self, pattern, text, flags, **kwargs)
+        self.workers = workers or os.cpu_count() or 1
+        self.min_size = min_size
+        self.executor = executor
+        self.parallel = False
+
+    def _finditer(self, compiled):
+        self.parallel = (self.workers > 1
+                         and self.engine == engines.BACKTRACKING
+                         and len(self.text) >= self.min_size
+                         and can_split_lines(compiled))
+        if not self.parallel:
+            return RegExAnalyzer._finditer(self, compiled)
+        return self._parallel_finditer(compiled)
+
+    def _parallel_finditer(self, compiled):
+        executor = self.executor or default_executor()
+        segments = split_lines(self.text, self.workers * 4)
+        width = (compiled.groups + 1) * 2
+        futures = []
+        for i, (start, end) in enumerate(segments):
+            last = i == len(segments) - 1
+            if isinstance(self.text, MappedFile):
+                # pickled by path, scanned in place
+                args = (self.text, start, end, 0)
+            else:
+                args = (self.text[start:end], 0, end - start, start)
+            futures.append(executor.submit(_scan_segment,
+                                           self.pattern, self.flags,
+                                           *args, last=last))
+        try:
+            for future in futures:
+                spans = future.result()
+                for i in range(0, len(spans), width):
+                    yield SegmentMatch(tuple(zip(spans[i:i + width:2],
+                                                 spans[i + 1:i + width:2])))
+        finally:
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,138 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Required-literal prefilter.
+
+Most patterns contain a literal which every match includes at a fixed,
+or almost fixed, distance from its start, e.g. ' ERROR' in
+r'\d\d ERROR'. Such patterns are scanned by looking for the literal
+with str.find()/bytes.find() and trying to match only at the few
+positions it allows, instead of letting the regex engine try every
+position of the text. Patterns which start with a literal are left
+to the re module, which looks for such a prefix on its own.
+"""
+
+import re
+
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_constants
+    import sre_parse
+
+# at most this many positions are tried for every literal found
+MAX_WINDOW = 16
+MIN_LITERAL_LENGTH = 2
+# if the literal is found every MIN_SKIP characters or more often
+# over CHECK_PERIOD occurrences, the regex engine is left to scan
+# the rest of the text on its own
+CHECK_PERIOD = 256
+MIN_SKIP = 256
+
+
+class RequiredLiteral:
+    """A literal included in every match of a pattern, at `lo`..`hi`
+    characters from the start of the match."""
+    __slots__ = ('literal', 'lo', 'hi')
+
+    def __init__(self, literal, lo, hi):
+        self.literal = literal
+        self.lo = lo
+        self.hi = hi
+
+    def __repr__(self):
+        return 'RequiredLiteral({!r}, {}, {})'.format(self.literal,
+                                                     self.lo, self.hi)
+
+
+def required_literal(compiled):
+    """Returns the best RequiredLiteral of a CompiledPattern
+    for prefiltering, or None if the pattern has none."""
+    if compiled.regex.flags & re.IGNORECASE:
+        return None
+    tree = compiled.tree
+    items = []
+    _flatten(tree.data, items)
+    if items and items[0][0] is sre_constants.LITERAL:
+        # the re module looks for a literal prefix on its own, faster
+        return None
+
+    as_literal = bytes if isinstance(compiled.pattern, bytes) else \
+        lambda codes: ''.join(map(chr, codes))
+    best = None
+    run = []
+    for i, item in enumerate(items + [None]):
+        if item is not None and item[0] is sre_constants.LITERAL:
+            run.append(item[1])
+            continue
+        if len(run) >= MIN_LITERAL_LENGTH:
+            before = items[:i - len(run)]
+            lo, hi = sre_parse.SubPattern(tree.state, before).getwidth()
+            if hi - lo < MAX_WINDOW:
+                candidate = RequiredLiteral(as_literal(run), lo, hi)
+                # the longest literal is the rarest one, usually
+                if best is None or len(candidate.literal) > len(best.literal):
+                    best = candidate
+        run = []
+    return best
+
+
+def _flatten(subpattern, items):
+    """Appends the top-level nodes of a sequence to `items`, replacing
+    plain groups with their contents."""
+    for op, av in subpattern:
+        if op is sre_constants.SUBPATTERN:
+            group, add_flags, del_flags, p = av
+            if not add_flags & re.IGNORECASE:
+                _flatten(p, items)
+                continue
+        items.append((op, av))
+
+
+def finditer(regex, text, required, pos=0):
+    """Yields the same matches as regex.finditer(text, pos), looking
+    for `required` (a RequiredLiteral of the pattern) first."""
+    find = text.find
+    match = regex.match
+    literal, lo, hi = required.literal, required.lo, required.hi
+    countdown = CHECK_PERIOD
+    checked = pos
+    while True:
+        countdown -= 1
+        if countdown == 0:
+            if pos - checked < CHECK_PERIOD * MIN_SKIP:
+                # the literal is too frequent for the prefilter to pay off
+                yield from regex.finditer(text, pos)
+                return
+            countdown = CHECK_PERIOD
+            checked = pos
+        found = find(literal, pos + lo)
+        if found == -1:
+            return
+        # a match starting before found - hi would need an earlier
+        # occurrence of the literal
+        last = found - lo
+        for start in range(max(pos, found - hi), last + 1):
+            mo = match(text, start)
+            if mo is not None:
+                yield mo
+                # matches including a literal are never empty
+                pos = mo.end()
+                break
+        else:
+            pos = last + 1
@@ -0,0 +1,650 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Backtracking step profiler.
+
+The parse tree of a pattern is compiled into a program of a
+backtracking matcher which follows the search order of sre: the same
+alternatives and repetitions are tried in the same order, and the same
+matches are found (except for some groups of possessive repetitions and
+conditionals referring to an enclosing group). Every executed instruction counts as a step of the
+sub-expression (parse tree node) it was compiled from, every return to
+an untried choice as a backtrack of the alternation or repetition which
+left it. The cost of every match attempt is recorded by its start.
+
+The counts model the work of sre rather than measure it: sre skips
+some attempts with its literal prefix scan and runs single-character
+repetitions in a tight loop. Case-insensitive matching is approximated
+with str.lower() and str.upper().
+"""
+
+import re
+import heapq
+
+try:
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_constants
+
+from .analyzer import (RegExAnalyzer, pattern_cache, FINISHED_SUCCESS,
+                       FINISHED_ERROR, FINISHED_TIMEOUT)
+from .linear import (UnsupportedPattern, LinearMatch, CHAR, SPLIT, JMP,
+                     SAVE, ASSERT, MATCH, _Builder, _code)
+
+# instructions in addition to those of linear.py
+R_INIT = 8      # (R_INIT, r): a repetition starts
+R_TEST = 9      # (R_TEST, r, lo, hi, greedy, exit): another iteration?
+                # the body follows, exit is the instruction after it
+R_NEXT = 10     # (R_NEXT, r, test): an iteration ends, back to R_TEST
+GROUPREF = 11   # (GROUPREF, group, ignorecase)
+COND = 12       # (COND, group, yes, no)
+LOOK = 13       # (LOOK, program, negate, behind): a lookaround,
+                # behind is the width of a lookbehind or None
+ATOMIC = 14     # (ATOMIC, program): the first match of the program only
+
+# the profiler stops after this many steps
+MAX_STEPS = 1000000
+# costliest match attempts kept
+HOT_ATTEMPTS = 10
+
+_c = sre_constants
+_ATOMIC_GROUP = getattr(_c, 'ATOMIC_GROUP', None)
+_POSSESSIVE_REPEAT = getattr(_c, 'POSSESSIVE_REPEAT', None)
+
+_FLAGS = ((re.ASCII, 'a'), (re.IGNORECASE, 'i'), (re.LOCALE, 'L'),
+          (re.MULTILINE, 'm'), (re.DOTALL, 's'), (re.VERBOSE, 'x'))
+_AT = {
+    _c.AT_BEGINNING: '^',
+    _c.AT_BEGINNING_LINE: '^',
+    _c.AT_BEGINNING_STRING: r'\A',
+    _c.AT_END: '$',
+    _c.AT_END_LINE: '$',
+    _c.AT_END_STRING: r'\Z',
+    _c.AT_BOUNDARY: r'\b',
+    _c.AT_NON_BOUNDARY: r'\B',
+}
+_CATEGORIES = {
+    _c.CATEGORY_DIGIT: r'\d',
+    _c.CATEGORY_NOT_DIGIT: r'\D',
+    _c.CATEGORY_SPACE: r'\s',
+    _c.CATEGORY_NOT_SPACE: r'\S',
+    _c.CATEGORY_WORD: r'\w',
+    _c.CATEGORY_NOT_WORD: r'\W',
+}
+# nodes which a quantifier applies to without a group
+_ATOMS = (_c.LITERAL, _c.NOT_LITERAL, _c.ANY, _c.IN, _c.SUBPATTERN,
+          _c.GROUPREF)
+
+
+class Node:
+    """A node of the parse tree, numbered in pre-order."""
+    __slots__ = ('index', 'parent', 'depth', 'text')
+
+    def __init__(self, index, parent, depth, text):
+        self.index = index
+        self.parent = parent
+        self.depth = depth
+        self.text = text
+
+
+def render(subpattern, names=None):
+    """Returns the pattern text of a sre_parse subpattern,
+    `names` maps group numbers to names."""
+    names = names or {}
+    parts = []
+    for op, av in subpattern:
+        text = _render(op, av, names)
+        if op is _c.BRANCH and len(subpattern) > 1:
+            text = '(?:{})'.format(text)
+        parts.append(text)
+    return ''.join(parts)
+
+
+def _render(op, av, names):
+    if op is _c.LITERAL:
+        return _literal(av)
+    if op is _c.NOT_LITERAL:
+        return '[^{}]'.format(_set_literal(av))
+    if op is _c.ANY:
+        return '.'
+    if op is _c.IN:
+        return _render_set(av)
+    if op is _c.AT:
+        return _AT.get(av, '')
+    if op is _c.BRANCH:
+        return '|'.join(render(p, names) for p in av[1])
+    if op is _c.SUBPATTERN:
+        group, add_flags, del_flags, p = av
+        if group is None:
+            return '(?{}:{})'.format(_flags(add_flags, del_flags),
+                                     render(p, names))
+        if group in names:
+            return '(?P<{}>{})'.format(names[group], render(p, names))
+        return '({})'.format(render(p, names))
+    if op in (_c.MAX_REPEAT, _c.MIN_REPEAT, _POSSESSIVE_REPEAT):
+        lo, hi, body = av
+        suffix = {(0, _c.MAXREPEAT): '*', (1, _c.MAXREPEAT): '+',
+                  (0, 1): '?'}.get((lo, hi))
+        if suffix is None:
+            if lo == hi:
+                suffix = '{{{}}}'.format(lo)
+            elif hi == _c.MAXREPEAT:
+                suffix = '{{{},}}'.format(lo)
+            else:
+                suffix = '{{{},{}}}'.format(lo, hi)
+        if op is _c.MIN_REPEAT:
+            suffix += '?'
+        elif op is _POSSESSIVE_REPEAT:
+            suffix += '+'
+        text = render(body, names)
+        if len(body) != 1 or body[0][0] not in _ATOMS:
+            text = '(?:{})'.format(text)
+        return text + suffix
+    if op is _c.GROUPREF:
+        return '\\{}'.format(av)
+    if op is _c.GROUPREF_EXISTS:
+        group, yes, no = av
+        text = '(?({}){}'.format(names.get(group, group), render(yes, names))
+        if no is not None:
+            text += '|' + render(no, names)
+        return text + ')'
+    if op in (_c.ASSERT, _c.ASSERT_NOT):
+        direction, p = av
+        prefix = '?<' if direction < 0 else '?'
+        prefix += '=' if op is _c.ASSERT else '!'
+        return '({}{})'.format(prefix, render(p, names))
+    if op is _ATOMIC_GROUP:
+        return '(?>{})'.format(render(av, names))
+    return str(op)
+
+
+def _literal(code):
+    return re.escape(chr(code))
+
+
+def _set_literal(code):
+    ch = chr(code)
+    return '\\' + ch if ch in '\\]^-' else ch
+
+
+def _render_set(items):
+    parts = []
+    for op, av in items:
+        if op is _c.NEGATE:
+            parts.append('^')
+        elif op is _c.LITERAL:
+            parts.append(_set_literal(av))
+        elif op is _c.RANGE:
+            parts.append('{}-{}'.format(_set_literal(av[0]),
+                                        _set_literal(av[1])))
+        elif op is _c.CATEGORY:
+            parts.append(_CATEGORIES.get(av, ''))
+    if len(parts) == 1 and parts[0] in _CATEGORIES.values():
+        return parts[0]
+    return '[{}]'.format(''.join(parts))
+
+
+def _flags(add_flags, del_flags):
+    text = ''.join(c for flag, c in _FLAGS if add_flags & flag)
+    removed = ''.join(c for flag, c in _FLAGS if del_flags & flag)
+    return text + ('-' + removed if removed else '')
+
+
+def _children(op, av):
+    """Returns the subpatterns directly below a node."""
+    if op is _c.BRANCH:
+        return av[1]
+    if op is _c.SUBPATTERN:
+        return [av[3]]
+    if op in (_c.MAX_REPEAT, _c.MIN_REPEAT, _POSSESSIVE_REPEAT):
+        return [av[2]]
+    if op is _c.GROUPREF_EXISTS:
+        return [p for p in av[1:] if p is not None]
+    if op in (_c.ASSERT, _c.ASSERT_NOT):
+        return [av[1]]
+    if op is _ATOMIC_GROUP:
+        return [av]
+    return []
+
+
+def number_nodes(tree, names=None):
+    """Returns the list of Node objects of the parse tree and a dict
+    mapping the id()s of the tree items to their nodes."""
+    names = names or {}
+    nodes = []
+    index = {}
+
+    def visit(subpattern, parent, depth):
+        for item in subpattern:
+            op, av = item
+            node = Node(len(nodes), parent, depth, _render(op, av, names))
+            nodes.append(node)
+            index[id(item)] = node
+            for p in _children(op, av):
+                visit(p, node, depth + 1)
+
+    visit(tree, None, 0)
+    return nodes, index
+
+
+class _Program:
+    """Instructions and the indices of the nodes they come from."""
+    def __init__(self, code, tags):
+        self.code = code
+        self.tags = tags
+
+
+class _ProfileBuilder(_Builder):
+    """Builds the programs of the backtracking matcher."""
+    def __init__(self, unicode, index, current, owner=None):
+        _Builder.__init__(self, unicode, reverse=False)
+        self.unicode = unicode
+        self.index = index
+        self.owner = owner if owner is not None else self
+        self.repeats = 0
+        self.tags = []
+        # the index of the node instructions are emitted for
+        self.current = current
+
+    def build(self, tree, flags):
+        self.emit(SAVE, 0)
+        self.sequence(tree, flags)
+        self.emit(SAVE, 1)
+        self.emit(MATCH)
+        return _Program(self.code, self.tags)
+
+    def subprogram(self, emit_body):
+        """Returns the program of the instructions emitted by
+        `emit_body(builder)`, followed by MATCH."""
+        builder = _ProfileBuilder(self.unicode, self.index, self.current,
+                                  self.owner)
+        emit_body(builder)
+        builder.emit(MATCH)
+        return _Program(builder.code, builder.tags)
+
+    def emit(self, *instruction):
+        index = _Builder.emit(self, *instruction)
+        self.tags.append(self.current)
+        return index
+
+    def sequence(self, subpattern, flags):
+        for item in subpattern:
+            outer = self.current
+            self.current = self.index[id(item)].index
+            self.node(item[0], item[1], flags)
+            self.current = outer
+
+    def node(self, op, av, flags):
+        ignorecase = flags & re.IGNORECASE
+        if op is _c.LITERAL and ignorecase:
+            self.emit(CHAR, self.fold(av.__eq__))
+        elif op is _c.NOT_LITERAL and ignorecase:
+            equal = self.fold(av.__eq__)
+            self.emit(CHAR, lambda code: not equal(code))
+        elif op is _c.IN and ignorecase:
+            self.emit(CHAR, self.fold(self.charset(av)))
+        elif op is _c.SUBPATTERN:
+            group, add_flags, del_flags, p = av
+            flags = (flags | add_flags) & ~del_flags
+            if group is not None:
+                self.emit(SAVE, group * 2)
+            self.sequence(p, flags)
+            if group is not None:
+                self.emit(SAVE, group * 2 + 1)
+        elif op is _c.GROUPREF:
+            self.emit(GROUPREF, av, bool(ignorecase))
+        elif op is _c.GROUPREF_EXISTS:
+            group, yes, no = av
+            cond = self.emit(COND, group, None, None)
+            self.code[cond][2] = len(self.code)
+            self.sequence(yes, flags)
+            if no is not None:
+                jump = self.emit(JMP, None)
+                self.code[cond][3] = len(self.code)
+                self.sequence(no, flags)
+                self.code[jump][1] = len(self.code)
+            else:
+                self.code[cond][3] = len(self.code)
+        elif op in (_c.ASSERT, _c.ASSERT_NOT):
+            direction, p = av
+            behind = None
+            if direction < 0:
+                behind = p.getwidth()[0]
+            program = self.subprogram(lambda b: b.sequence(p, flags))
+            self.emit(LOOK, program, op is _c.ASSERT_NOT, behind)
+        elif op is _ATOMIC_GROUP:
+            self.emit(ATOMIC,
+                      self.subprogram(lambda b: b.sequence(av, flags)))
+        elif op is _POSSESSIVE_REPEAT:
+            self.emit(ATOMIC,
+                      self.subprogram(lambda b: b.repeat(True, av, flags)))
+        else:
+            _Builder.node(self, op, av, flags)
+
+    def repeat(self, greedy, av, flags):
+        lo, hi, body = av
+        repeat = self.owner.repeats
+        self.owner.repeats += 1
+        self.emit(R_INIT, repeat)
+        test = self.emit(R_TEST, repeat, lo, hi, greedy, None)
+        self.sequence(body, flags)
+        self.emit(R_NEXT, repeat, test)
+        self.code[test][5] = len(self.code)
+
+    def fold(self, test):
+        """Returns a test of a character which is also true for
+        the characters of another case."""
+        if self.unicode:
+            def cases(code):
+                ch = chr(code)
+                return (ord(c) for c in (ch.lower(), ch.upper())
+                        if len(c) == 1)
+        else:
+            def cases(code):
+                if code < 128:
+                    ch = chr(code)
+                    return (ord(ch.lower()), ord(ch.upper()))
+                return ()
+        return lambda code: test(code) or any(test(c) for c in cases(code))
+
+
+class _OutOfSteps(Exception):
+    pass
+
+
+class Profiler:
+    """Finds the matches of a CompiledPattern with the instrumented
+    backtracking matcher, see finditer().
+
+    `nodes` are the Node objects of the parse tree, `steps` and
+    `backtracks` the counts of the nodes themselves by node index.
+    `hot_attempts` holds the (steps, start) pairs of the costliest match
+    attempts. `complete` is set once the whole text has been searched,
+    a search stops after `max_steps` steps or once `should_stop()`
+    returns True (it is called every CHECK_PERIOD steps).
+    """
+    CHECK_PERIOD = 4096
+
+    def __init__(self, compiled, max_steps=MAX_STEPS, should_stop=None):
+        flags = compiled.regex.flags
+        names = {number: name
+                 for name, number in compiled.groupindex.items()}
+        self.nodes, index = number_nodes(compiled.tree, names)
+        # the steps of the instructions which belong to no node (those
+        # recording the match span) are counted after those of the nodes
+        builder = _ProfileBuilder(bool(flags & re.UNICODE), index,
+                                  len(self.nodes))
+        self.program = builder.build(compiled.tree, flags)
+        self.groups = compiled.groups
+        self.repeats = builder.repeats
+        self.max_steps = max_steps
+        self.should_stop = should_stop
+        self.steps = [0] * (len(self.nodes) + 1)
+        self.backtracks = [0] * (len(self.nodes) + 1)
+        self.total_steps = 0
+        self.total_backtracks = 0
+        self.hot_attempts = []
+        self.complete = False
+        self._limit = 0
+        self._text = None
+
+    def finditer(self, text, pos=0):
+        """Yields the LinearMatch objects of the matches which
+        re.finditer(text, pos) would find, counting the steps."""
+        self._text = text
+        self._limit = min(self.total_steps + self.CHECK_PERIOD,
+                          self.max_steps)
+        size = len(text)
+        slots = (-1,) * (2 * (self.groups + 1))
+        reps = ((0, -1),) * self.repeats
+        after_empty = False
+        while pos <= size:
+            before = self.total_steps
+            try:
+                result = self._run(self.program, pos, slots, reps,
+                                   forbid_empty=after_empty)
+            except _OutOfSteps:
+                self._record_attempt(pos, before)
+                return
+            self._record_attempt(pos, before)
+            if result is None:
+                pos += 1
+                after_empty = False
+                continue
+            end, regs, _ = result
+            yield LinearMatch(text, tuple(zip(regs[::2], regs[1::2])))
+            after_empty = end == pos
+            pos = end
+        self.complete = True
+
+    def inclusive(self):
+        """Returns the (steps, backtracks) lists of the nodes together
+        with the nodes below them."""
+        steps = self.steps[:len(self.nodes)]
+        backtracks = self.backtracks[:len(self.nodes)]
+        # children are numbered after their parents
+        for node in reversed(self.nodes):
+            if node.parent is not None:
+                steps[node.parent.index] += steps[node.index]
+                backtracks[node.parent.index] += backtracks[node.index]
+        return steps, backtracks
+
+    def hottest_attempts(self):
+        """Returns the (steps, start) pairs of the costliest match
+        attempts, the costliest first."""
+        return sorted(self.hot_attempts, reverse=True)
+
+    def _record_attempt(self, start, before):
+        entry = (self.total_steps - before, start)
+        if len(self.hot_attempts) < HOT_ATTEMPTS:
+            heapq.heappush(self.hot_attempts, entry)
+        elif entry > self.hot_attempts[0]:
+            heapq.heapreplace(self.hot_attempts, entry)
+
+    def _checkpoint(self):
+        if self.total_steps >= self.max_steps:
+            raise _OutOfSteps()
+        if self.should_stop is not None and self.should_stop():
+            raise _OutOfSteps()
+        self._limit = min(self.total_steps + self.CHECK_PERIOD,
+                          self.max_steps)
+
+    def _run(self, program, pos, slots, reps, forbid_empty=False):
+        """Runs the program from `pos`, returns the position, slots and
+        repetition states of its first match or None."""
+        code = program.code
+        tags = program.tags
+        text = self._text
+        size = len(text)
+        steps = self.steps
+        backtracks = self.backtracks
+        start = pos
+        stack = []
+        pc = 0
+        while True:
+            ins = code[pc]
+            op = ins[0]
+            steps[tags[pc]] += 1
+            self.total_steps += 1
+            if self.total_steps >= self._limit:
+                self._checkpoint()
+
+            if op == CHAR:
+                if pos < size and ins[1](_code(text, pos)):
+                    pos += 1
+                    pc += 1
+                    continue
+            elif op == SPLIT:
+                stack.append((ins[2], pos, slots, reps, tags[pc]))
+                pc = ins[1]
+                continue
+            elif op == JMP:
+                pc = ins[1]
+                continue
+            elif op == SAVE:
+                slot = ins[1]
+                slots = slots[:slot] + (pos,) + slots[slot + 1:]
+                pc += 1
+                continue
+            elif op == ASSERT:
+                if ins[1](text, pos):
+                    pc += 1
+                    continue
+            elif op == R_INIT:
+                r = ins[1]
+                reps = reps[:r] + ((0, -1),) + reps[r + 1:]
+                pc += 1
+                continue
+            elif op == R_TEST:
+                _, r, lo, hi, greedy, exit = ins
+                count, last = reps[r]
+                if count < lo:
+                    pc += 1
+                    continue
+                # an optional iteration may not match the empty string
+                if count < hi and pos != last:
+                    started = reps[:r] + ((count, pos),) + reps[r + 1:]
+                    if greedy:
+                        stack.append((exit, pos, slots, reps, tags[pc]))
+                        reps = started
+                        pc += 1
+                    else:
+                        stack.append((pc + 1, pos, slots, started,
+                                      tags[pc]))
+                        pc = exit
+                    continue
+                pc = exit
+                continue
+            elif op == R_NEXT:
+                r = ins[1]
+                count, last = reps[r]
+                reps = reps[:r] + ((count + 1, last),) + reps[r + 1:]
+                pc = ins[2]
+                continue
+            elif op == GROUPREF:
+                group_start = slots[ins[1] * 2]
+                group_end = slots[ins[1] * 2 + 1]
+                if group_start != -1 and group_end != -1:
+                    end = pos + group_end - group_start
+                    value = text[group_start:group_end]
+                    found = text[pos:end]
+                    if ins[2]:
+                        value = value.lower()
+                        found = found.lower()
+                    if end <= size and found == value:
+                        pos = end
+                        pc += 1
+                        continue
+            elif op == COND:
+                group = ins[1]
+                matched = (slots[group * 2] != -1
+                           and slots[group * 2 + 1] != -1)
+                pc = ins[2] if matched else ins[3]
+                continue
+            elif op == LOOK:
+                _, sub, negate, behind = ins
+                at = pos if behind is None else pos - behind
+                result = None
+                if at >= 0:
+                    result = self._run(sub, at, slots, reps)
+                if negate:
+                    if result is None:
+                        pc += 1
+                        continue
+                elif result is not None:
+                    # groups of a positive lookaround are kept
+                    slots = result[1]
+                    pc += 1
+                    continue
+            elif op == ATOMIC:
+                result = self._run(ins[1], pos, slots, reps)
+                if result is not None:
+                    pos, slots, reps = result
+                    pc += 1
+                    continue
+            elif op == MATCH:
+                if not (forbid_empty and pos == start):
+                    return pos, slots, reps
+
+            # the instruction failed
+            if not stack:
+                return None
+            pc, pos, slots, reps, tag = stack.pop()
+            backtracks[tag] += 1
+            self.total_backtracks += 1
+
+
+class ProfilingRegExAnalyzer(RegExAnalyzer):
+    """RegExAnalyzer which finds the matches with a Profiler,
+    available as `profile` once the analysis runs.
+
+    Running out of `max_steps` finishes the analysis in FINISHED_TIMEOUT
+    state, with the matches found and the steps counted so far.
+    Results are not cached by default.
+    """
+    def __init__(self, pattern='', text='', flags=0, max_steps=MAX_STEPS,
+                 **kwargs):
+        kwargs.setdefault('cache', None)
+        RegExAnalyzer.__init__(self, pattern, text, flags, **kwargs)
+        self.max_steps = max_steps
+        self._profile = None
+
+    @property
+    def profile(self):
+        with self._lock:
+            return self._profile
+
+    def run(self, *args, **kwargs):
+        try:
+            compiled = pattern_cache.get(self.pattern, self.flags)
+        except Exception:
+            # reported by RegExAnalyzer.run()
+            compiled = None
+        if compiled is not None:
+            try:
+                profile = Profiler(compiled, self.max_steps,
+                                   should_stop=lambda: self._stop_flag)
+            except UnsupportedPattern as e:
+                self._set_state(FINISHED_ERROR,
+                                'The pattern can not be profiled: {}'
+                                .format(e))
+                return
+            with self._lock:
+                self._profile = profile
+        RegExAnalyzer.run(self, *args, **kwargs)
+
+    def _finditer(self, compiled):
+        return self._profile.finditer(self.text)
+
+    def _set_success(self):
+        profile = self._profile
+        if self._stop_flag:
+            return
+        mcount = len(self._matches)
+        if not profile.complete:
+            self._set_state(FINISHED_TIMEOUT,
+                            'Profiling stopped after {} steps, {} {} found '
+                            'so far.'.format(profile.total_steps, mcount,
+                                             ['match', 'matches'][mcount != 1]))
+            return
+        self._set_state(FINISHED_SUCCESS,
+                        'Profiling complete, {} {} found in {} steps '
+                        'and {} backtracks.'
+                        .format(mcount, ['match', 'matches'][mcount != 1],
+                                profile.total_steps,
+                                profile.total_backtracks))
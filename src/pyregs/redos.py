@@ -0,0 +1,360 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Static analysis of the backtracking risk of patterns.
+
+The parse tree of a pattern is inspected for constructs which let
+a backtracking engine match the same text in many ways, which takes
+exponential or polynomial time when the rest of the pattern fails:
+
+* nested quantifiers over overlapping characters, e.g. (a+)+ or
+  (\w+\s?)*, where the inner repetition can both start and end
+  an iteration of the outer one,
+* alternatives under repetition which can match the same text,
+  e.g. (\w|\d)+ or (a|a?)+, or one of which can match what two
+  iterations of others match, e.g. (a|b|ab)*,
+* consecutive quantifiers over overlapping characters, separated by
+  nothing but optional parts, e.g. \d+\d* or \w+\s*\w+.
+
+Characters are compared on a sample of ASCII, a few non-ASCII
+characters of every category and the literals of the pattern, so sets
+are never built. Atomic groups and possessive repetitions do not
+backtrack and are not reported. This is a heuristic: it is fast enough
+to run on every edit of the pattern, but it may miss or overstate risks.
+"""
+
+import re
+
+try:
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_constants
+
+from .linear import _Builder
+from .profiler import render
+
+SAFE = 0
+POLYNOMIAL = 1
+EXPONENTIAL = 2
+SEVERITY_NAMES = ('none', 'polynomial', 'exponential')
+
+_c = sre_constants
+_REPEATS = (_c.MAX_REPEAT, _c.MIN_REPEAT)
+_ATOMIC_GROUP = getattr(_c, 'ATOMIC_GROUP', None)
+_POSSESSIVE_REPEAT = getattr(_c, 'POSSESSIVE_REPEAT', None)
+# non-breaking and em space, e acute, Cyrillic Zhe, Arabic-Indic three,
+# a CJK ideograph
+_SAMPLES = tuple(range(128)) + (0xa0, 0x2003, 0xe9, 0x416, 0x663, 0x4e2d)
+_EMPTY = frozenset()
+
+
+class Risk:
+    """A construct of a pattern which risks catastrophic backtracking.
+    `text` is the construct in pattern syntax."""
+    __slots__ = ('severity', 'text', 'reason')
+
+    def __init__(self, severity, text, reason):
+        self.severity = severity
+        self.text = text
+        self.reason = reason
+
+    def __repr__(self):
+        return 'Risk({}, {!r}, {!r})'.format(SEVERITY_NAMES[self.severity],
+                                             self.text, self.reason)
+
+
+def analyze(compiled):
+    """Returns the list of Risk objects of a CompiledPattern,
+    the most severe first."""
+    analysis = _Analysis(compiled)
+    analysis.sequence(compiled.tree, compiled.regex.flags)
+    return sorted(analysis.risks, key=lambda risk: -risk.severity)
+
+
+def severity(risks):
+    """Returns the severity of the most severe of the risks."""
+    return max((risk.severity for risk in risks), default=SAFE)
+
+
+class _Info:
+    """What a subpattern can match: the characters it can start and end
+    with, any it can consume, whether it can match the empty string, and
+    the characters of the unbounded repetitions it can start and end
+    with (`head` and `tail`)."""
+    __slots__ = ('first', 'last', 'chars', 'nullable', 'head', 'tail')
+
+    def __init__(self, first=_EMPTY, last=_EMPTY, chars=_EMPTY,
+                 nullable=True, head=_EMPTY, tail=_EMPTY):
+        self.first = first
+        self.last = last
+        self.chars = chars
+        self.nullable = nullable
+        self.head = head
+        self.tail = tail
+
+
+class _Analysis:
+    def __init__(self, compiled):
+        flags = compiled.regex.flags
+        self.builder = _Builder(bool(flags & re.UNICODE), reverse=False)
+        self.names = {number: name
+                      for name, number in compiled.groupindex.items()}
+        self.samples = _SAMPLES + tuple(_literals(compiled.tree))
+        self.all = frozenset(self.samples)
+        self.risks = []
+        self._reported = set()
+        self._infos = {}
+
+    def report(self, severity, text, reason):
+        if (text, reason) not in self._reported:
+            self._reported.add((text, reason))
+            self.risks.append(Risk(severity, text, reason))
+
+    def sequence(self, subpattern, flags):
+        """Returns the _Info of a subpattern, checking it and
+        the subpatterns below it on the first call."""
+        key = (id(subpattern), flags)
+        info = self._infos.get(key)
+        if info is None:
+            items = list(subpattern)
+            infos = [self.item(op, av, flags) for op, av in items]
+            self._check_consecutive(items, infos)
+            info = self._infos[key] = _concat(infos)
+        return info
+
+    def item(self, op, av, flags):
+        if op in (_c.LITERAL, _c.NOT_LITERAL, _c.ANY, _c.IN):
+            chars = self.chars(op, av, flags)
+            return _Info(chars, chars, chars, False)
+        if op is _c.SUBPATTERN:
+            group, add_flags, del_flags, p = av
+            return self.sequence(p, (flags | add_flags) & ~del_flags)
+        if op is _c.BRANCH:
+            infos = [self.sequence(p, flags) for p in av[1]]
+            return _union(infos)
+        if op in _REPEATS:
+            return self.repeat(op, av, flags)
+        if op is _POSSESSIVE_REPEAT:
+            info = self.sequence(av[2], flags)
+            return _Info(info.first, info.last, info.chars,
+                         info.nullable or av[0] == 0)
+        if op is _ATOMIC_GROUP:
+            info = self.sequence(av, flags)
+            return _Info(info.first, info.last, info.chars, info.nullable)
+        if op in (_c.ASSERT, _c.ASSERT_NOT):
+            # checked, but they consume nothing
+            self.sequence(av[1], flags)
+            return _Info()
+        if op is _c.GROUPREF:
+            return _Info(self.all, self.all, self.all)
+        if op is _c.GROUPREF_EXISTS:
+            group, yes, no = av
+            infos = [self.sequence(yes, flags)]
+            if no is not None:
+                infos.append(self.sequence(no, flags))
+            else:
+                infos.append(_Info())
+            return _union(infos)
+        # anchors
+        return _Info()
+
+    def repeat(self, op, av, flags):
+        lo, hi, body = av
+        info = self.sequence(body, flags)
+        if hi > 1:
+            self._check_nested(op, av, info, flags)
+            self._check_alternatives(op, av, flags)
+        head, tail = info.head, info.tail
+        if hi == _c.MAXREPEAT and info.chars:
+            head = tail = info.chars
+        return _Info(info.first, info.last, info.chars,
+                     info.nullable or lo == 0, head, tail)
+
+    def chars(self, op, av, flags):
+        """Returns the sample characters matched by a character node."""
+        if op is _c.LITERAL:
+            test = av.__eq__
+        elif op is _c.NOT_LITERAL:
+            test = av.__ne__
+        elif op is _c.ANY:
+            if flags & re.DOTALL:
+                return self.all
+            test = (ord('\n')).__ne__
+        else:
+            test = self.builder.charset(av)
+        if flags & re.IGNORECASE:
+            return frozenset(code for code in self.samples
+                             if any(test(c) for c in _cases(code)))
+        return frozenset(code for code in self.samples if test(code))
+
+    def _check_nested(self, op, av, info, flags):
+        """An inner repetition which can both start and end an iteration
+        splits a run of characters among the iterations in many ways."""
+        lo, hi, body = av
+        for inner_op, inner_av, inner_flags in _repeats_below(body, flags):
+            inner_lo, inner_hi, inner_body = inner_av
+            if inner_hi <= 1 or inner_hi == inner_lo:
+                continue
+            chars = self.sequence(inner_body, inner_flags).chars
+            if chars & info.first and chars & info.last:
+                self.report(_repeat_severity(hi),
+                            render([(op, av)], self.names),
+                            'nested quantifiers over overlapping characters')
+                return
+
+    def _check_alternatives(self, op, av, flags):
+        """Alternatives which can match the same text let every
+        iteration match it in more than one way, and so does
+        an alternative which can match what an iteration matching
+        another one and the next one matching a third one match."""
+        lo, hi, body = av
+        for branch_av, branch_flags in _branches_below(body, flags):
+            infos = [self.sequence(p, branch_flags) for p in branch_av[1]]
+            for i, a in enumerate(infos):
+                for b in infos[i + 1:]:
+                    if ((a.nullable and b.nullable)
+                            or (a.first & b.first and a.last & b.last)):
+                        self.report(_repeat_severity(hi),
+                                    render([(op, av)], self.names),
+                                    'alternatives matching the same text '
+                                    'under repetition')
+                        return
+            for i, c in enumerate(infos):
+                others = infos[:i] + infos[i + 1:]
+                heads = [a for a in others if a.first & c.first]
+                tails = [b for b in others if b.last & c.last]
+                if any(a is not b for a in heads for b in tails):
+                    self.report(_repeat_severity(hi),
+                                render([(op, av)], self.names),
+                                'alternative matching a sequence of '
+                                'others under repetition')
+                    return
+
+    def _check_consecutive(self, items, infos):
+        """Two unbounded repetitions over the same characters split
+        a run of them in as many ways as it is long."""
+        for i, info in enumerate(infos):
+            if not info.tail:
+                continue
+            for j in range(i + 1, len(infos)):
+                if info.tail & infos[j].head:
+                    self.report(POLYNOMIAL,
+                                render(items[i:j + 1], self.names),
+                                'consecutive quantifiers over '
+                                'overlapping characters')
+                    break
+                if not infos[j].nullable:
+                    break
+
+
+def _repeat_severity(hi):
+    return EXPONENTIAL if hi == _c.MAXREPEAT else POLYNOMIAL
+
+
+def _concat(infos):
+    """The _Info of a sequence of subpatterns."""
+    first = last = chars = head = tail = _EMPTY
+    for info in infos:
+        first |= info.first
+        head |= info.head
+        if not info.nullable:
+            break
+    for info in reversed(infos):
+        last |= info.last
+        tail |= info.tail
+        if not info.nullable:
+            break
+    for info in infos:
+        chars |= info.chars
+    return _Info(first, last, chars, all(i.nullable for i in infos),
+                 head, tail)
+
+
+def _union(infos):
+    """The _Info of alternatives."""
+    info = _Info(nullable=any(i.nullable for i in infos))
+    for i in infos:
+        info.first |= i.first
+        info.last |= i.last
+        info.chars |= i.chars
+        info.head |= i.head
+        info.tail |= i.tail
+    return info
+
+
+def _cases(code):
+    ch = chr(code)
+    return [code] + [ord(c) for c in (ch.lower(), ch.upper()) if len(c) == 1]
+
+
+def _literals(subpattern):
+    """Yields the character codes written in the pattern."""
+    for op, av in subpattern:
+        if op is _c.LITERAL or op is _c.NOT_LITERAL:
+            yield av
+        elif op is _c.IN:
+            for set_op, set_av in av:
+                if set_op is _c.LITERAL:
+                    yield set_av
+                elif set_op is _c.RANGE:
+                    yield from set_av
+        else:
+            for p in _subpatterns(op, av):
+                yield from _literals(p)
+
+
+def _subpatterns(op, av):
+    if op is _c.BRANCH:
+        return av[1]
+    if op is _c.SUBPATTERN:
+        return [av[3]]
+    if op in _REPEATS or op is _POSSESSIVE_REPEAT:
+        return [av[2]]
+    if op is _c.GROUPREF_EXISTS:
+        return [p for p in av[1:] if p is not None]
+    if op in (_c.ASSERT, _c.ASSERT_NOT):
+        return [av[1]]
+    if op is _ATOMIC_GROUP:
+        return [av]
+    return []
+
+
+def _walk(subpattern, flags):
+    """Yields the (op, av, flags) of the nodes of a subpattern which
+    can be backtracked into, i.e. those outside of atomic groups,
+    possessive repetitions and lookarounds."""
+    for op, av in subpattern:
+        yield op, av, flags
+        if op is _c.SUBPATTERN:
+            group, add_flags, del_flags, p = av
+            yield from _walk(p, (flags | add_flags) & ~del_flags)
+        elif op in (_c.BRANCH, _c.GROUPREF_EXISTS) or op in _REPEATS:
+            for p in _subpatterns(op, av):
+                yield from _walk(p, flags)
+
+
+def _repeats_below(subpattern, flags):
+    for op, av, node_flags in _walk(subpattern, flags):
+        if op in _REPEATS:
+            yield op, av, node_flags
+
+
+def _branches_below(subpattern, flags):
+    for op, av, node_flags in _walk(subpattern, flags):
+        if op is _c.BRANCH:
+            yield av, node_flags
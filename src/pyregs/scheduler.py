@@ -0,0 +1,83 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+
+class Scheduler:
+    """Runs callbacks in the Tk event loop of `widget` after a delay.
+
+    Jobs are identified by keys: scheduling a job under the key of a
+    pending one cancels the pending job first. Nothing runs while no
+    job is pending.
+    """
+    def __init__(self, widget):
+        self._widget = widget
+        self._jobs = {}
+
+    def schedule(self, key, delay, callback, *args):
+        """Runs callback(*args) in `delay` milliseconds."""
+        self.cancel(key)
+
+        def run():
+            del self._jobs[key]
+            callback(*args)
+
+        self._jobs[key] = self._widget.after(int(delay), run)
+
+    def cancel(self, key):
+        after_id = self._jobs.pop(key, None)
+        if after_id is not None:
+            self._widget.after_cancel(after_id)
+
+    def cancel_all(self):
+        for key in list(self._jobs):
+            self.cancel(key)
+
+    def pending(self, key):
+        return key in self._jobs
+
+
+class Debouncer:
+    """Calls `callback` once no restart() happened for `delay` ms.
+
+    The delay adapts to the cost of the work done by the callback:
+    report_cost() with the duration of that work (in seconds) makes
+    the next delay `cost_factor` times that duration, but not less
+    than `delay` and not more than `max_delay` milliseconds.
+    """
+    def __init__(self, scheduler, delay, callback,
+                 max_delay=None, cost_factor=0):
+        self._scheduler = scheduler
+        self._key = object()
+        self.callback = callback
+        self.min_delay = delay
+        self.max_delay = max_delay if max_delay is not None else delay
+        self.cost_factor = cost_factor
+        self.delay = delay
+
+    def restart(self, *args, **kwargs):
+        self._scheduler.schedule(self._key, self.delay, self.callback)
+
+    def stop(self):
+        self._scheduler.cancel(self._key)
+
+    @property
+    def pending(self):
+        return self._scheduler.pending(self._key)
+
+    def report_cost(self, seconds):
+        delay = seconds * 1000 * self.cost_factor
+        self.delay = int(min(max(delay, self.min_delay), self.max_delay))
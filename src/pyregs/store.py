@@ -0,0 +1,238 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import copy
+from array import array
+from bisect import bisect_left
+from itertools import chain
+
+
+class MatchView:
+    """A lightweight view of a single match in a MatchStore.
+
+    Mimics the parts of the re match object interface used by PyRegs.
+    Group values are sliced out of the analyzed text on access.
+    `index` is the position of the match in store.spans.
+    """
+    __slots__ = ('_store', '_spans', '_base')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._spans = store.spans
+        self._base = index * store.width
+
+    def start(self, group=0):
+        return self._spans[self._base + group * 2]
+
+    def end(self, group=0):
+        return self._spans[self._base + group * 2 + 1]
+
+    def span(self, group=0):
+        i = self._base + group * 2
+        spans = self._spans
+        return (spans[i], spans[i + 1])
+
+    @property
+    def regs(self):
+        return tuple(self.span(g) for g in range(self._store.groups_count + 1))
+
+    def group(self, group=0):
+        start, end = self.span(group)
+        if start == -1:
+            return None
+        return self._store.text[start:end]
+
+    def groups(self):
+        return tuple(self.group(g)
+                     for g in range(1, self._store.groups_count + 1))
+
+
+class MatchStore:
+    """Compact storage of analysis results.
+
+    Instead of keeping re match objects alive, the start/end offsets of
+    every match and its groups are packed into a flat array of 64-bit
+    integers: (groups_count + 1) pairs per match, -1 for groups which
+    did not participate in the match. MatchView objects are created
+    on access only.
+    """
+    def __init__(self, text=None, groups_count=0, groupindex=None,
+                 spans=None):
+        self.text = text
+        self.groups_count = groups_count
+        self.groupindex = groupindex if groupindex is not None else {}
+        self.spans = spans if spans is not None else array('q')
+
+    @property
+    def width(self):
+        """Number of array items per match."""
+        return (self.groups_count + 1) * 2
+
+    def append(self, mo):
+        extend = self.spans.extend
+        for span in mo.regs:
+            extend(span)
+
+    def detach(self):
+        """Returns a copy of the store which shares the spans
+        but does not reference the analyzed text."""
+        return self.attach(None)
+
+    def attach(self, text):
+        """Returns a copy of the store which shares the spans
+        and references the given text."""
+        store = copy.copy(self)
+        store.text = text
+        return store
+
+    @property
+    def nbytes(self):
+        return (sys.getsizeof(self) + sys.getsizeof(self.groupindex)
+                + self.spans.itemsize * len(self.spans))
+
+    @property
+    def materialized(self):
+        """Number of leading matches held in memory."""
+        return len(self.spans) // self.width
+
+    def __len__(self):
+        return len(self.spans) // self.width
+
+    def __getitem__(self, index):
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('match index out of range')
+        return MatchView(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield MatchView(self, i)
+
+    def bisect_end(self, offset, lo=0, hi=None):
+        """Returns the index of the first match which ends at or after
+        `offset`. Matches are found in order, so are their ends."""
+        if hi is None:
+            hi = len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid].end() < offset:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def __getstate__(self):
+        # the analyzed text is never pickled along with the spans
+        state = self.__dict__.copy()
+        state['text'] = None
+        return state
+
+
+class PagedMatchStore(MatchStore):
+    """A MatchStore which counts every match but keeps the spans
+    of at most `page_size` consecutive matches in memory.
+
+    Every `checkpoint_interval`-th match is recorded as a checkpoint.
+    Accessing a match outside of the current page re-scans the text
+    with `regex` from the nearest preceding checkpoint and loads
+    the page around the requested match. MatchView objects taken
+    from a previous page stay valid.
+    """
+    def __init__(self, text=None, groups_count=0, groupindex=None,
+                 regex=None, page_size=100000, checkpoint_interval=10000):
+        MatchStore.__init__(self, text, groups_count, groupindex)
+        self.regex = regex
+        self.page_size = page_size
+        self.checkpoint_interval = checkpoint_interval
+        self.count = 0
+        self.offset = 0
+        # start/end pairs of every checkpoint_interval-th match
+        self.checkpoints = array('q')
+
+    def append(self, mo):
+        if self.count % self.checkpoint_interval == 0:
+            self.checkpoints.extend(mo.span())
+        if self.count < self.page_size:
+            MatchStore.append(self, mo)
+        self.count += 1
+
+    @property
+    def nbytes(self):
+        return (MatchStore.nbytes.fget(self)
+                + self.checkpoints.itemsize * len(self.checkpoints))
+
+    @property
+    def materialized(self):
+        if self.offset:
+            return 0
+        return len(self.spans) // self.width
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('match index out of range')
+        page_len = len(self.spans) // self.width
+        if not self.offset <= index < self.offset + page_len:
+            self._load_page(index)
+        return MatchView(self, index - self.offset)
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def bisect_end(self, offset):
+        # searching between two checkpoints loads one page at most
+        interval = self.checkpoint_interval
+        checkpoint = bisect_left(self.checkpoints[1::2], offset)
+        lo = max(0, (checkpoint - 1) * interval + 1)
+        hi = min(checkpoint * interval, self.count)
+        return MatchStore.bisect_end(self, offset, lo, hi)
+
+    def _load_page(self, index):
+        first = max(0, min(index - self.page_size // 2,
+                           self.count - self.page_size))
+        last = min(first + self.page_size, self.count)
+        checkpoint = first // self.checkpoint_interval
+        start = self.checkpoints[checkpoint * 2]
+        end = self.checkpoints[checkpoint * 2 + 1]
+
+        matches = self.regex.finditer(self.text, start)
+        # the first match found from the checkpoint position might be
+        # an empty match which preceded the checkpoint match
+        for mo in matches:
+            if mo.span() == (start, end):
+                break
+
+        spans = array('q')
+        i = checkpoint * self.checkpoint_interval
+        for mo in chain([mo], matches):
+            if i >= last:
+                break
+            if i >= first:
+                for span in mo.regs:
+                    spans.extend(span)
+            i += 1
+
+        self.spans = spans
+        self.offset = first
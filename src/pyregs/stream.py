@@ -0,0 +1,218 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Streaming analysis of text files which do not fit into memory.
+
+The file is read and decoded in chunks, the pattern runs over a sliding
+window of the text. Matches are produced by generators, so the memory
+used does not depend on the size of the file.
+"""
+
+import os
+import codecs
+
+from .analyzer import RegExAnalyzer, FINISHED_ERROR, pattern_cache
+
+CHUNK_SIZE = 1024 * 1024
+OVERLAP = 64 * 1024
+
+
+class StreamMatch:
+    """A match found in a stream.
+
+    Offsets are global character offsets in the decoded stream. Since the
+    text is not retained, the values of the match groups are kept along
+    with their spans.
+    """
+    __slots__ = ('regs', '_values')
+
+    def __init__(self, mo, base):
+        self.regs = tuple((start + base, end + base) if start != -1
+                          else (-1, -1)
+                          for start, end in mo.regs)
+        self._values = (mo.group(),) + mo.groups()
+
+    def start(self, group=0):
+        return self.regs[group][0]
+
+    def end(self, group=0):
+        return self.regs[group][1]
+
+    def span(self, group=0):
+        return self.regs[group]
+
+    def group(self, group=0):
+        return self._values[group]
+
+    def groups(self):
+        return self._values[1:]
+
+
+def iter_matches(regex, chunks, overlap=OVERLAP):
+    """Yields StreamMatch objects of `regex` over the text consisting
+    of the given `chunks`.
+
+    Matches crossing chunk boundaries are found exactly once, provided
+    that matching at any position never needs to look more than `overlap`
+    characters ahead or behind of it. In particular, matches must be
+    shorter than `overlap`.
+    """
+    if overlap <= 0:
+        raise ValueError('overlap must be positive')
+
+    buf = type(regex.pattern)()
+    base = 0            # global offset of buf[0]
+    pos = 0             # position in buf to resume scanning from
+    last_span = None    # global span of the last yielded match
+    chunks = iter(chunks)
+    eof = False
+    while not eof:
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+        else:
+            buf += chunk
+        # matches ending behind the limit might change with more data
+        limit = len(buf) if eof else len(buf) - overlap
+        if not eof and limit <= pos:
+            continue
+
+        resume = max(pos, limit)
+        for mo in regex.finditer(buf, pos):
+            if mo.end() > limit:
+                resume = mo.start()
+                break
+            span = (mo.start() + base, mo.end() + base)
+            # an empty match at the resume position is found again
+            if span == last_span:
+                continue
+            last_span = span
+            yield StreamMatch(mo, base)
+
+        # keep some context in front of the resume position for
+        # lookbehind assertions, word boundaries and anchors
+        keep = max(0, resume - overlap)
+        buf = buf[keep:]
+        base += keep
+        pos = resume - keep
+
+
+def read_chunks(path, encoding='utf-8', errors='strict',
+                chunk_size=CHUNK_SIZE, on_read=None):
+    """Yields decoded chunks of the file at `path`.
+
+    `on_read` is called with the number of bytes read after every read.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if on_read is not None:
+                on_read(len(data))
+            text = decoder.decode(data, final=not data)
+            if text:
+                yield text
+            if not data:
+                return
+
+
+def iter_file_matches(path, pattern, flags=0, encoding='utf-8',
+                      errors='strict', chunk_size=CHUNK_SIZE,
+                      overlap=OVERLAP):
+    """Yields StreamMatch objects of the pattern over the decoded
+    contents of the file at `path`, see iter_matches()."""
+    regex = pattern_cache.get(pattern, flags).regex
+    chunks = read_chunks(path, encoding, errors, chunk_size)
+    return iter_matches(regex, chunks, overlap)
+
+
+class StreamMatchStore:
+    """Keeps the first `page_size` matches of a stream and
+    counts the rest."""
+    def __init__(self, groups_count=0, groupindex=None, page_size=None):
+        self.groups_count = groups_count
+        self.groupindex = groupindex if groupindex is not None else {}
+        self.page_size = page_size
+        self.count = 0
+        self._matches = []
+
+    def append(self, mo):
+        if self.page_size is None or self.count < self.page_size:
+            self._matches.append(mo)
+        self.count += 1
+
+    @property
+    def materialized(self):
+        return len(self._matches)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('match index out of range')
+        if index >= len(self._matches):
+            raise IndexError('match #{} was not kept, only the first {} '
+                             'matches of a stream are'
+                             .format(index + 1, self.page_size))
+        return self._matches[index]
+
+
+class StreamingRegExAnalyzer(RegExAnalyzer):
+    """RegExAnalyzer of a text file read in chunks.
+
+    The `text` of the analyzer is the path to the file. Only the first
+    `page_size` matches are kept, all of them are counted.
+    """
+    def __init__(self, pattern='', path='', flags=0, page_size=10000,
+                 encoding='utf-8', errors='strict',
+                 chunk_size=CHUNK_SIZE, overlap=OVERLAP):
+        RegExAnalyzer.__init__(self, pattern, path, flags, cache=None,
+                               page_size=page_size)
+        self.encoding = encoding
+        self.errors = errors
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._file_size = 0
+        self._bytes_read = 0
+
+    def run(self, *args, **kwargs):
+        try:
+            RegExAnalyzer.run(self, *args, **kwargs)
+        except (OSError, UnicodeError) as e:
+            self._set_state(FINISHED_ERROR,
+                            'Unable to read {}: {}'.format(self.text, e))
+
+    def _finditer(self, compiled):
+        self._file_size = os.path.getsize(self.text)
+        chunks = read_chunks(self.text, self.encoding, self.errors,
+                             self.chunk_size, self._on_read)
+        return iter_matches(compiled.regex, chunks, self.overlap)
+
+    def _on_read(self, size):
+        self._bytes_read += size
+
+    def _progress(self, mo):
+        if self._file_size == 0:
+            return 1.0
+        return self._bytes_read / self._file_size
+
+    def _make_store(self, compiled):
+        return StreamMatchStore(compiled.groups, compiled.groupindex,
+                                self.page_size)
@@ -0,0 +1,61 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Conversion of text offsets to line and column numbers."""
+
+from array import array
+from bisect import bisect_right
+
+
+class LineIndex:
+    """Offsets of the line starts of a text (str or bytes).
+
+    Built once per text, it converts an offset into a (line, column)
+    pair with a binary search instead of walking the text.
+    Lines are numbered from 1 and columns from 0, like in Tk indices.
+    """
+    def __init__(self, text):
+        newline = '\n' if isinstance(text, str) else b'\n'
+        self.text = text
+        self.starts = starts = array('q', [0])
+        # no copy of the text is made, nor a string per line
+        append = starts.append
+        find = text.find
+        pos = find(newline)
+        while pos != -1:
+            pos += 1
+            append(pos)
+            pos = find(newline, pos)
+
+    def __len__(self):
+        """Number of lines."""
+        return len(self.starts)
+
+    def line(self, offset):
+        """Returns the number of the line containing `offset`."""
+        return bisect_right(self.starts, offset)
+
+    def line_start(self, line):
+        return self.starts[line - 1]
+
+    def position(self, offset):
+        """Returns the (line, column) of `offset`."""
+        line = bisect_right(self.starts, offset)
+        return line, offset - self.starts[line - 1]
+
+    def offset(self, line, column):
+        return self.starts[line - 1] + column
@@ -56,6 +56,8 @@ create_contents() : creates the contents of the tooltip window (by default a Tki
 
 import tkinter
 
+from .scheduler import Scheduler
+
 class ToolTip:
     def __init__(self, master, text='Your text here', delay=1500, **opts):
         self.master = master
@@ -65,7 +67,7 @@ class ToolTip:
                       'width':0, 'wraplength':150}
         self.configure(**opts)
         self._tipwindow = None
-        self._id = None
+        self._scheduler = Scheduler(self.master)
         self._id1 = self.master.bind("<Enter>", self.enter, '+')
         self._id2 = self.master.bind("<Leave>", self.leave, '+')
         self._id3 = self.master.bind("<ButtonPress>", self.leave, '+')
@@ -102,13 +104,10 @@ class ToolTip:
         self._unschedule()
         if self._opts['state'] == 'disabled':
             return
-        self._id = self.master.after(self._opts['delay'], self._show)
+        self._scheduler.schedule('show', self._opts['delay'], self._show)
 
     def _unschedule(self):
-        id = self._id
-        self._id = None
-        if id:
-            self.master.after_cancel(id)
+        self._scheduler.cancel('show')
 
     def _show(self):
         if self._opts['state'] == 'disabled':
@@ -1,8 +1,10 @@
-import time
 import tkinter as tk
 import tkinter.ttk as ttk
+from array import array
 from idlelib.WidgetRedirector import WidgetRedirector
 
+from .textindex import LineIndex
+
 
 # From:
 # http://code.activestate.com/recipes/464635-call-a-callback-when-a-tkintertext-is-modified/
@@ -74,6 +76,7 @@ class PRText(TextModifiedMixin, tk.Text):
         kwargs.update(dict(wrap=tk.WORD, yscrollcommand=scrollbar.set))
         tk.Text.__init__(self, master, *args, **kwargs)
         scrollbar.config(command=self.yview)
+        self.scrollbar = scrollbar
         self._setup_menu(master)
         TextModifiedMixin.__init__(self)
 
@@ -159,11 +162,265 @@ class PRReadonlyText(PRText):
         self.readonly = True
 
 
+class PRWindowedText(PRReadonlyText):
+    """A read-only Text which shows a window of at most `window_size`
+    characters of a (possibly huge) source text.
+
+    The window is moved when the view is scrolled close to its edges
+    and the scrollbar shows the position in the whole source, so the
+    cost of displaying the source does not depend on its size.
+    Tags added with tag_span() are kept across window moves.
+    Source offsets are converted to Text indices through a LineIndex,
+    which is built once per source.
+    """
+    EDGE = 0.1
+
+    def __init__(self, *args, **kwargs):
+        self.window_size = kwargs.pop('window_size', 65536)
+        PRReadonlyText.__init__(self, *args, **kwargs)
+        self.source = ''
+        self.lines = LineIndex('')
+        self.base = 0
+        self.window_end = 0
+        self._base_line = 1
+        self._spans = {}
+        self._refill_pending = False
+        self.config(yscrollcommand=self._on_yscroll)
+        self.scrollbar.config(command=self._on_scrollbar)
+
+    def load(self, source, offset=0):
+        """Shows the window of `source` around `offset`."""
+        self.source = source
+        if self.lines.text != source:
+            self.lines = LineIndex(source)
+        self._spans = {}
+        self._load_window(offset)
+
+    def clear(self):
+        self.source = ''
+        self.base = self.window_end = 0
+        self._base_line = 1
+        self._spans = {}
+        PRReadonlyText.clear(self)
+
+    def index_of(self, offset):
+        """Converts an offset in the source to a Text index."""
+        line, column = self.lines.position(offset)
+        if line == self._base_line:
+            # the window may start in the middle of a line
+            column = offset - self.base
+        return '{}.{}'.format(line - self._base_line + 1, column)
+
+    def offset_of(self, index):
+        """Converts a Text index to an offset in the source."""
+        line, column = map(int, self.index(index).split('.'))
+        if line == 1:
+            return self.base + column
+        return self.lines.offset(line + self._base_line - 1, column)
+
+    def visible_range(self):
+        """Returns the source offsets of the first and the last
+        visible characters."""
+        last = '@{},{}'.format(self.winfo_width(), self.winfo_height())
+        return self.offset_of('@0,0'), self.offset_of(last)
+
+    def on_view_changed(self):
+        """Override this method to get notified when the view
+        is scrolled or the window is moved."""
+        pass
+
+    def show(self, start, end=None):
+        """Moves the window to and scrolls to the source range."""
+        end = start if end is None else end
+        if not (self.base <= start and end <= self.window_end):
+            self._load_window(start, end - start)
+        self.see(self.index_of(start))
+
+    def tag_span(self, tag, start, end):
+        """Adds the tag to a range of the source."""
+        self._spans.setdefault(tag, []).append((start, end))
+        self._tag_window(tag, start, end)
+
+    def tag_clear(self, tag):
+        self._spans.pop(tag, None)
+        self.tag_remove(tag, '1.0', tk.END)
+
+    def _tag_window(self, tag, start, end):
+        start = max(start, self.base)
+        end = min(end, self.window_end)
+        if start <= end:
+            self.tag_add(tag, self.index_of(start), self.index_of(end))
+
+    def _load_window(self, offset, length=0):
+        size = max(self.window_size, length + self.window_size // 2)
+        base = max(0, min(offset - (size - length) // 2,
+                          len(self.source) - size))
+        self.base = base
+        self.window_end = min(len(self.source), base + size)
+        self._base_line = self.lines.line(base)
+        self.text = self.source[self.base:self.window_end]
+        for tag, spans in self._spans.items():
+            for start, end in spans:
+                self._tag_window(tag, start, end)
+
+    def _on_yscroll(self, first, last):
+        first, last = float(first), float(last)
+        total = len(self.source)
+        if total == 0:
+            self.scrollbar.set(first, last)
+            return
+        length = self.window_end - self.base
+        self.scrollbar.set((self.base + first * length) / total,
+                           (self.base + last * length) / total)
+        self.on_view_changed()
+        if ((first < self.EDGE and self.base > 0)
+                or (last > 1 - self.EDGE and self.window_end < total)):
+            if not self._refill_pending:
+                self._refill_pending = True
+                self.after_idle(self._refill)
+
+    def _refill(self):
+        self._refill_pending = False
+        top = self.offset_of('@0,0')
+        self._load_window(top)
+        self.yview(self.index_of(top))
+
+    def _on_scrollbar(self, *args):
+        if args[0] == 'moveto' and self.source:
+            offset = int(float(args[1]) * len(self.source))
+            if not self.base <= offset < self.window_end:
+                self._load_window(offset)
+            self.yview(self.index_of(offset))
+        else:
+            self.yview(*args)
+
+
 class PRTreeview(ttk.Treeview):
     def clear(self):
-        tree_elems = self.get_children()
-        for elem in tree_elems:
-            self.delete(elem)
+        self.delete(*self.get_children())
+
+
+class PRVirtualTable(ttk.Frame):
+    """A table of `count` rows, only the visible ones of which exist
+    as Treeview items, so its size does not matter.
+
+    Override (or bind()) get_row() to return the column values of a row
+    and sort_key() to return the sort key function of a column. Rows are
+    identified by their index, whatever the sort order.
+    """
+    def __init__(self, master, rows=10, **kwargs):
+        ttk.Frame.__init__(self, master, **kwargs)
+        self.tree = PRTreeview(self, show='headings', height=rows,
+                               selectmode='browse')
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL,
+                                       command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.rows = rows
+        self.count = 0
+        self.top = 0
+        self.headings = {}
+        self.order = None
+        self.sort_column = None
+        self.sort_reverse = False
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+        self.tree.bind('<MouseWheel>',
+                       lambda e: self.scroll(-3 if e.delta > 0 else 3))
+        self.tree.bind('<Button-4>', lambda e: self.scroll(-3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll(3))
+
+    def get_row(self, index):
+        return ()
+
+    def sort_key(self, column):
+        """Returns a function of the row index, None for the natural
+        order of the rows."""
+        return None
+
+    def on_row_selected(self, index):
+        pass
+
+    def set_columns(self, columns):
+        """Sets the columns from a sequence of (id, heading) pairs."""
+        self.tree.clear()
+        self.tree['columns'] = [column for column, heading in columns]
+        self.headings = dict(columns)
+        for column, heading in columns:
+            self.tree.heading(column, text=heading,
+                              command=lambda c=column: self.sort(c))
+        self._reset_order()
+
+    def set_count(self, count):
+        """Sets the number of rows, a sort order is reset if it changes."""
+        if count != self.count:
+            self._reset_order()
+        self.count = count
+        self.top = max(0, min(self.top, count - self.rows))
+        self.refresh()
+
+    def sort(self, column):
+        if column == self.sort_column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self._reset_order()
+            self.sort_column = column
+            key = self.sort_key(column)
+            if key is not None:
+                self.order = array('q', sorted(range(self.count), key=key))
+        for c, heading in self.headings.items():
+            if c == column:
+                heading += ' ▼' if self.sort_reverse else ' ▲'
+            self.tree.heading(c, text=heading)
+        self.top = 0
+        self.refresh()
+
+    def _reset_order(self):
+        self.order = None
+        self.sort_column = None
+        self.sort_reverse = False
+        for column, heading in self.headings.items():
+            self.tree.heading(column, text=heading)
+
+    def _row_index(self, position):
+        if self.sort_reverse:
+            position = self.count - 1 - position
+        if self.order is not None:
+            return self.order[position]
+        return position
+
+    def refresh(self):
+        """Re-creates the visible rows."""
+        self.tree.clear()
+        last = min(self.top + self.rows, self.count)
+        for position in range(self.top, last):
+            index = self._row_index(position)
+            self.tree.insert('', tk.END, iid=str(index),
+                             values=self.get_row(index))
+        if self.count:
+            self.scrollbar.set(self.top / self.count, last / self.count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll(self, rows):
+        self.scroll_to(self.top + rows)
+
+    def scroll_to(self, position):
+        top = max(0, min(position, self.count - self.rows))
+        if top != self.top:
+            self.top = top
+            self.refresh()
+
+    def _on_scrollbar(self, *args):
+        if args[0] == tk.MOVETO:
+            self.scroll_to(int(float(args[1]) * self.count))
+        elif args[0] == tk.SCROLL:
+            step = self.rows if args[2] == tk.PAGES else 1
+            self.scroll(int(args[1]) * step)
+
+    def _on_select(self, event=None):
+        selection = self.tree.selection()
+        if selection:
+            self.on_row_selected(int(selection[0]))
 
 
 class PRSpinbox(EntryModifiedMixin, tk.Spinbox):
@@ -231,29 +488,3 @@ class PRCheckbutton(tk.Checkbutton):
     def checked(self, value):
         val = int(value == True)
         self._var.set(val)
-
-
-class Timer:
-    BASE_TICK = 100
-
-    def __init__(self, tk, period, callback):
-        self._tk = tk
-        self.started = False
-        self.callback = callback
-        self.started_time = 0
-        self.period = period / 1000
-        self._tick()
-
-    def restart(self, *args, **kwargs):
-        self.started = True
-        self.started_time = time.time()
-
-    def stop(self):
-        self.started = False
-
-    def _tick(self):
-        if self.started and time.time() - self.started_time > self.period:
-            self.started = False
-            self.callback()
-        self._tk.after(self.BASE_TICK, self._tick)
-
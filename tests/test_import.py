@@ -0,0 +1,63 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""The library interface has to stay cheap to import: no GUI toolkit,
+no process pools, and a bounded import time."""
+
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+
+# seconds, measured in a fresh interpreter
+IMPORT_BUDGET = 0.5
+HEAVY_MODULES = ('tkinter', 'idlelib', 'multiprocessing')
+
+PROBE = '''
+import sys, time, json
+started = time.perf_counter()
+import pyregs
+elapsed = time.perf_counter() - started
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))
+'''
+
+
+class ImportTest(unittest.TestCase):
+    def setUp(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [SRC] + [p for p in [env.get('PYTHONPATH')] if p])
+        output = subprocess.check_output([sys.executable, '-c', PROBE],
+                                         env=env)
+        self.result = json.loads(output.decode())
+
+    def test_no_heavy_modules(self):
+        modules = self.result['modules']
+        for name in HEAVY_MODULES:
+            self.assertNotIn(name, modules)
+
+    def test_import_budget(self):
+        self.assertLess(self.result['elapsed'], IMPORT_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+# Copyright (C) 2013 by Zaur Nasibov.
+#
+# This file is part of PyRegs.
+#
+# PyRegs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyRegs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyRegs.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""The linear engine, the prefilter and the incremental re-scan have to
+find exactly the matches of re.finditer()."""
+
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'src'))
+
+from pyregs import engines, prefilter
+from pyregs.analyzer import RegExAnalyzer, pattern_cache
+from pyregs.incremental import IncrementalRegExAnalyzer
+
+TEXTS = (
+    '',
+    'a',
+    'aaa bbb',
+    'ab abab ba',
+    'foo bar\nbaz qux\n',
+    'x=1 y=22\nzz=333 =4\n',
+    '\n\nab\n\n',
+    'abc abd ab abc\nabc',
+    'a==1 b=>22 12ab 3ab\nx==',
+)
+
+# patterns run by every engine, with empty matches, anchors, word
+# boundaries and lazy quantifiers
+PATTERNS = (
+    r'a',
+    r'a*',
+    r'a*?',
+    r'b|',
+    r'(a|ab)(c|bcd)?',
+    r'\b',
+    r'\B',
+    r'\bab\b',
+    r'\w+',
+    r'\w+?',
+    r'(\w)(\w)?',
+    r'^',
+    r'$',
+    r'(?m)^\w*$',
+    r'(?m)$',
+    r'\A\w+',
+    r'\w+\Z',
+    r'.*',
+    r'(?s).+?',
+    r'(\w+)=(\d+)',
+    r'a{2,3}?',
+    r'(?:ab)*',
+    r'[^\n]*\n',
+)
+
+# patterns with a required literal not at their start
+PREFILTERED = (
+    r'\w==\d',
+    r'\d\dab',
+    r'\w{1,3}?ab',
+    r'.?bc',
+    r'\bab\b',
+    r'(?m)^.ab',
+    r'[a-z]{2}\n\n',
+    r'(\w)(?:=>)\d*',
+)
+
+POSITIONS = (0, 1, 3)
+
+# (offset, removed, inserted): edits near the start, middle and end
+EDITS = (
+    (0, 0, 'a'),
+    (0, 1, ''),
+    (2, 1, 'xy'),
+    (3, 0, '\n'),
+    (4, 2, 'ab'),
+    (-1, 1, ''),
+    (-1, 0, 'abc'),
+)
+
+
+def spans(matches):
+    return [mo.regs for mo in matches]
+
+
+class LinearEngineTest(unittest.TestCase):
+    def test_same_as_re(self):
+        engine = engines.get_engine(engines.LINEAR)
+        for pattern in PATTERNS:
+            compiled = pattern_cache.get(pattern, 0)
+            for text in TEXTS:
+                for pos in POSITIONS:
+                    with self.subTest(pattern=pattern, text=text, pos=pos):
+                        self.assertEqual(
+                            spans(engine.finditer(compiled, text, pos)),
+                            spans(compiled.regex.finditer(text, pos)))
+
+    def test_bytes(self):
+        engine = engines.get_engine(engines.LINEAR)
+        for pattern in (rb'\w+', rb'a*?', rb'\b', rb'(?m)^\w*$'):
+            compiled = pattern_cache.get(pattern, 0)
+            for text in TEXTS:
+                text = text.encode()
+                with self.subTest(pattern=pattern, text=text):
+                    self.assertEqual(spans(engine.finditer(compiled, text)),
+                                     spans(re.finditer(pattern, text)))
+
+
+class PrefilterTest(unittest.TestCase):
+    def test_same_as_re(self):
+        for pattern in PREFILTERED:
+            compiled = pattern_cache.get(pattern, 0)
+            required = prefilter.required_literal(compiled)
+            self.assertIsNotNone(required, pattern)
+            for text in TEXTS + (TEXTS[-1] * 50, 'x=1 ' * 2000):
+                for pos in POSITIONS:
+                    with self.subTest(pattern=pattern, text=text[:20],
+                                      pos=pos):
+                        self.assertEqual(
+                            spans(prefilter.finditer(compiled.regex, text,
+                                                     required, pos)),
+                            spans(compiled.regex.finditer(text, pos)))
+
+
+class IncrementalTest(unittest.TestCase):
+    def analyze(self, pattern, text, previous=None):
+        if previous is None:
+            anl = RegExAnalyzer(pattern, text, cache=None)
+        else:
+            anl = IncrementalRegExAnalyzer(pattern, text, previous=previous,
+                                           cache=None)
+        anl.run()
+        return anl
+
+    def test_same_as_re(self):
+        resumed = 0
+        for pattern in PATTERNS + PREFILTERED:
+            for text in TEXTS[1:]:
+                previous = self.analyze(pattern, text)
+                for offset, removed, inserted in EDITS:
+                    offset %= len(text)
+                    edited = (text[:offset] + inserted
+                              + text[offset + removed:])
+                    with self.subTest(pattern=pattern, text=text,
+                                      edited=edited):
+                        anl = self.analyze(pattern, edited, previous)
+                        resumed += anl.incremental
+                        self.assertEqual(spans(anl.matches),
+                                         spans(re.finditer(pattern, edited)))
+        # most of the edits have to be re-scanned incrementally
+        self.assertGreater(resumed, 0)
+
+    def test_page_size(self):
+        text = 'ab ' * 100
+        previous = self.analyze(r'\w+', text)
+        edited = text + 'cd '
+        anl = IncrementalRegExAnalyzer(r'\w+', edited, previous=previous,
+                                       cache=None, page_size=10)
+        anl.run()
+        self.assertFalse(anl.incremental)
+        self.assertEqual(len(anl.matches), 101)
+        self.assertEqual(anl.matches[100].span(), (300, 302))
+
+
+if __name__ == '__main__':
+    unittest.main()